@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+# On-disk cache of parsed B3DList/B3DTree results.
+#
+# Every entry is a single file: a small JSON header describing the tree,
+# followed by the raw bytes of its arrays, 16-byte aligned. Warm loads map
+# the file and hand out read-only NumPy views, so arrays are never copied.
+# Entries are keyed by path, size, mtime (and optionally a content hash),
+# and the least recently used ones are evicted past a total size limit.
+
+import os
+import mmap
+import json
+import struct
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from .B3DParser import dotdict
+except ImportError:
+    from B3DParser import dotdict
+
+MAGIC = b'B3DC'
+VERSION = 2
+ALIGN = 16
+
+class B3DCache:
+    def __init__(self, cache_dir, max_size=1<<30, use_hash=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.use_hash = use_hash
+
+    def key(self, filepath, kind):
+        st = os.stat(filepath)
+        source = {'path':os.path.abspath(filepath), 'size':st.st_size, 'mtime':st.st_mtime_ns, 'kind':kind}
+        if self.use_hash:
+            source['hash'] = file_hash(filepath)
+        key = hashlib.sha1(json.dumps(source, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + '.b3dc'), source
+
+    def load(self, filepath, kind):
+        path, source = self.key(filepath, kind)
+        mm = None
+        try:
+            with open(path, 'rb') as fp:
+                mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, size = struct.unpack_from('4sII', mm, 0)
+            if magic != MAGIC or version != VERSION:
+                return None
+            header = json.loads(bytes(mm[12:12+size]))
+            if header['source'] != source:
+                return None
+            # array offsets are relative to the aligned end of the header
+            base = align(12 + size)
+            arrays = [view(mm, np.dtype(dtype), shape, base+offset)
+                      for dtype, shape, offset in header['arrays']]
+            mm = None # the arrays keep the map open
+        except (OSError, ValueError, KeyError, struct.error):
+            # missing, truncated or foreign entries are plain misses
+            return None
+        finally:
+            if mm is not None:
+                mm.close()
+
+        # bump the entry for LRU eviction, read-only caches just don't
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return decode(header['data'], arrays)
+
+    def store(self, filepath, kind, data):
+        path, source = self.key(filepath, kind)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        arrays = []
+        header = {'source':source, 'arrays':[], 'data':encode(data, arrays)}
+        offset = 0
+        for a in arrays:
+            header['arrays'].append((a.dtype.str, a.shape, offset))
+            offset = align(offset + a.nbytes)
+        meta = json.dumps(header).encode()
+        base = align(12 + len(meta))
+
+        tmp = path + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as fp:
+            fp.write(struct.pack('4sII', MAGIC, VERSION, len(meta)))
+            fp.write(meta)
+            for a, (dtype, shape, offset) in zip(arrays, header['arrays']):
+                fp.write(b'\x00' * (base + offset - fp.tell()))
+                fp.write(a.tobytes())
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.b3dc'):
+                # another process may have evicted it since listdir
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.b3dc'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def view(mm, dtype, shape, offset):
+    count = 1
+    for n in shape:
+        count *= n
+    if not count:
+        return np.empty(shape, dtype)
+    return np.frombuffer(mm, dtype, count=count, offset=offset).reshape(shape)
+
+def file_hash(filepath):
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as fp:
+        for block in iter(lambda: fp.read(1<<20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+# JSON-safe encoding that keeps tuples apart from lists and moves arrays out of line
+def encode(value, arrays):
+    if isinstance(value, dict):
+        return {'d': {k: encode(v, arrays) for k, v in value.items()}}
+    elif isinstance(value, tuple):
+        return {'t': [encode(v, arrays) for v in value]}
+    elif isinstance(value, list):
+        return [encode(v, arrays) for v in value]
+    elif np is not None and isinstance(value, np.ndarray):
+        arrays.append(np.ascontiguousarray(value))
+        return {'a': len(arrays)-1}
+    return value
+
+def decode(value, arrays):
+    if isinstance(value, dict):
+        if 'd' in value:
+            return dotdict({k: decode(v, arrays) for k, v in value['d'].items()})
+        elif 't' in value:
+            return tuple(decode(v, arrays) for v in value['t'])
+        return arrays[value['a']]
+    elif isinstance(value, list):
+        return [decode(v, arrays) for v in value]
+    return value
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# Compact alternative to the dotdict results of B3DList/B3DTree: every
+# element of the file is a small __slots__ object without a per-instance
+# dict, which keeps resident memory low when many models are held at once.
+
+try:
+    from .B3DParser import B3DParser
+except ImportError:
+    from B3DParser import B3DParser
+
+class Slots:
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__ if k not in ('parent', 'nodes'))
+        return '%s(%s)' % (type(self).__name__, fields)
+
+
+class Texture(Slots):
+    __slots__ = ('name', 'position', 'scale', 'rotation')
+
+    def __init__(self, name, position, scale, rotation):
+        self.name = name
+        self.position = position
+        self.scale = scale
+        self.rotation = rotation
+
+
+class Brush(Slots):
+    __slots__ = ('name', 'rgba', 'shine', 'blend', 'fx', 'tids')
+
+    def __init__(self, name, rgba, shine, blend, fx, tids):
+        self.name = name
+        self.rgba = rgba
+        self.shine = shine
+        self.blend = blend
+        self.fx = fx
+        self.tids = tids
+
+
+class Surface(Slots):
+    # one TRIS chunk: triangles sharing a brush
+    __slots__ = ('brush_id', 'indices')
+
+    def __init__(self, brush_id, indices):
+        self.brush_id = brush_id
+        self.indices = indices
+
+
+class Mesh(Slots):
+    __slots__ = ('brush_id', 'vertices', 'normals', 'rgba', 'uvs', 'surfaces')
+
+    def __init__(self, brush_id=-1):
+        self.brush_id = brush_id
+        self.vertices = self.normals = self.rgba = self.uvs = None
+        self.surfaces = []
+
+
+class KeyTrack(Slots):
+    # one KEYS chunk as columns, absent channels are empty
+    __slots__ = ('flags', 'frames', 'positions', 'scales', 'rotations')
+
+    def __init__(self, flags, frames, positions, scales, rotations):
+        self.flags = flags
+        self.frames = frames
+        self.positions = positions
+        self.scales = scales
+        self.rotations = rotations
+
+    @classmethod
+    def from_keys(cls, keys):
+        # legacy tuples output is a list of per-key dicts
+        first = keys[0] if keys else {}
+        flags = ('position' in first) | ('scale' in first) << 1 | ('rotation' in first) << 2
+        return cls(flags, [k['frame'] for k in keys],
+            [k['position'] for k in keys if 'position' in k],
+            [k['scale'] for k in keys if 'scale' in k],
+            [k['rotation'] for k in keys if 'rotation' in k])
+
+
+class Node(Slots):
+    __slots__ = ('name', 'position', 'rotation', 'scale', 'parent', 'nodes',
+                 'mesh', 'bones', 'keys', 'anim')
+
+    def __init__(self, parent=None):
+        self.name = ''
+        self.position = self.rotation = self.scale = None
+        self.parent = parent
+        self.nodes = []
+        self.mesh = None
+        self.bones = None
+        self.keys = []
+        self.anim = None
+
+
+class Model(Slots):
+    __slots__ = ('version', 'textures', 'brushes', 'nodes', 'anim')
+
+    def __init__(self):
+        self.version = None
+        self.textures = []
+        self.brushes = []
+        self.nodes = []
+        self.anim = None
+
+
+class B3DModel(B3DParser):
+    def __init__(self, **kwargs):
+        B3DParser.__init__(self, **kwargs)
+        self.model = Model()
+        self.node = None
+
+    def cb_next(self):
+        node = Node(self.node)
+        (self.node.nodes if self.node else self.model.nodes).append(node)
+        self.node = node
+
+    def cb_prev(self):
+        self.node = self.node.parent
+
+    def cb_data(self, chunk, data):
+        node = self.node
+
+        if chunk=='NODE':
+            node.name = data['name']
+            node.position = data['position']
+            node.rotation = data['rotation']
+            node.scale = data['scale']
+        elif chunk=='MESH':
+            node.mesh = Mesh(data['brush_id'])
+        elif chunk=='VRTS':
+            if node.mesh is None:
+                node.mesh = Mesh()
+            node.mesh.vertices = data['vertices']
+            node.mesh.normals = data['normals']
+            node.mesh.rgba = data['rgba']
+            node.mesh.uvs = data['uvs']
+        elif chunk=='TRIS':
+            if node.mesh is None:
+                node.mesh = Mesh()
+            node.mesh.surfaces.append(Surface(data['brush_id'], data['indices']))
+        elif chunk=='BONE':
+            node.bones = data['bones']
+        elif chunk=='KEYS':
+            if isinstance(data, list):
+                node.keys.append(KeyTrack.from_keys(data))
+            else:
+                node.keys.append(KeyTrack(data.flags, data.frames, data.positions, data.scales, data.rotations))
+        elif chunk=='ANIM':
+            (node or self.model).anim = data
+        elif chunk=='TEXS':
+            self.model.textures = [Texture(t.name, t.position, t.scale, t.rotation) for t in data['textures']]
+        elif chunk=='BRUS':
+            self.model.brushes = [Brush(m.name, m.rgba, m.shine, m.blend, m.fx, m.tids) for m in data['materials']]
+        elif chunk=='BB3D':
+            self.model.version = data['version']
+
+    def cb_result(self):
+        return self.model
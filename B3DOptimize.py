@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+# Mesh and animation passes for the exporter that need only NumPy, so they
+# also work on B3DWriter pipelines outside Blender: vertex welding, Tom
+# Forsyth's linear-speed vertex cache triangle order, first-use vertex order,
+# the ACMR (vertex cache misses per triangle) to measure it, keyframe
+# reduction and batched matrix composition and decomposition.
+
+from collections import deque
+
+import numpy as np
+
+# post-transform cache size the triangle order is tuned for and measured with
+CACHE_SIZE = 32
+
+def weld_vertices(values, epsilon):
+    # rows whose values round to the same multiple of epsilon are merged (rows on
+    # either side of a rounding boundary are not, however close); returns the first
+    # row of every welded vertex in first-use order, and the welded index of every row
+    keys = np.round(values / epsilon).astype(np.int64) if epsilon > 0 else values
+    order = np.lexsort(keys.T[::-1])
+    rows = keys[order]
+    new = np.ones(len(rows), bool)
+    new[1:] = (rows[1:] != rows[:-1]).any(axis=1)
+    starts = np.flatnonzero(new)
+    first = np.minimum.reduceat(order, starts)
+    inverse = np.empty(len(rows), np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    # number welded vertices by first use
+    by_use = np.argsort(first)
+    rank = np.empty(len(by_use), np.int64)
+    rank[by_use] = np.arange(len(by_use))
+    return first[by_use], rank[inverse]
+
+def acmr(triangles, cache_size=CACHE_SIZE):
+    # misses per triangle of a FIFO cache, 3.0 is no reuse at all, 0.5 is the ideal for large grids
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    cache = deque()
+    cached = set()
+    misses = 0
+    for v in triangles.ravel().tolist():
+        if v not in cached:
+            misses += 1
+            cache.append(v)
+            cached.add(v)
+            if len(cache) > cache_size:
+                cached.discard(cache.popleft())
+    return misses / len(triangles) if len(triangles) else 0.0
+
+def forsyth_order(triangles, cache_size=CACHE_SIZE):
+    # greedy triangle order: emit the live triangle with the best vertex scores among
+    # those touching the simulated LRU cache; returns the new order of triangle indices
+    triangles = np.asarray(triangles, np.int64).reshape(-1, 3)
+    count = len(triangles)
+    if not count:
+        return np.empty(0, np.int64)
+
+    # triangles of every vertex, as slices of one flat list
+    flat = triangles.ravel()
+    valence = np.bincount(flat)
+    offsets = np.concatenate(([0], np.cumsum(valence))).tolist()
+    adjacency = (np.argsort(flat, kind='stable') // 3).tolist()
+    remaining = valence.tolist()
+
+    cache_scores = [0.75]*3 + [(1 - (i-3) / (cache_size-3)) ** 1.5 for i in range(3, cache_size)]
+    valence_scores = [0.0] + [2.0 * n ** -0.5 for n in range(1, max(remaining)+1)]
+
+    def score(position, live):
+        if not live:
+            return -1.0
+        return (cache_scores[position] if position >= 0 else 0.0) + valence_scores[live]
+
+    vertex_scores = [score(-1, n) for n in remaining]
+    tris = triangles.tolist()
+    scores = [vertex_scores[a] + vertex_scores[b] + vertex_scores[c] for a, b, c in tris]
+    emitted = [False]*count
+    order = []
+    cache = []
+    best = max(range(count), key=scores.__getitem__)
+    cursor = 0
+
+    while True:
+        order.append(best)
+        emitted[best] = True
+        tri = tris[best]
+        for v in tri:
+            remaining[v] -= 1
+
+        # the triangle's vertices move to the front, the tail falls out
+        cache = list(dict.fromkeys(tri + cache))
+        changed = [(v, i if i < cache_size else -1) for i, v in enumerate(cache)]
+        cache = cache[:cache_size]
+
+        for v, position in changed:
+            new = score(position, remaining[v])
+            delta = new - vertex_scores[v]
+            if delta:
+                vertex_scores[v] = new
+                for t in adjacency[offsets[v]:offsets[v+1]]:
+                    scores[t] += delta
+
+        best = -1
+        best_score = -1.0
+        for v in cache:
+            for t in adjacency[offsets[v]:offsets[v+1]]:
+                if not emitted[t] and scores[t] > best_score:
+                    best, best_score = t, scores[t]
+
+        if best < 0:
+            # nothing live touches the cache, continue with the next triangle in input order
+            while cursor < count and emitted[cursor]:
+                cursor += 1
+            if cursor == count:
+                break
+            best = cursor
+
+    return np.array(order, np.int64)
+
+def first_use_order(triangles, vertex_count):
+    # vertices by first use in triangles (unused ones last), and the new index of every vertex
+    flat = np.asarray(triangles, np.int64).ravel()
+    used, first = np.unique(flat, return_index=True)
+    order = np.concatenate((used[np.argsort(first)], np.setdiff1d(np.arange(vertex_count), used)))
+    remap = np.empty(vertex_count, np.int64)
+    remap[order] = np.arange(vertex_count)
+    return order, remap
+
+def reduce_keys(frames, positions, scales, rotations, position_tolerance=0.001,
+                scale_tolerance=0.001, rotation_tolerance=0.001):
+    # greedy key reduction: from every kept key the segment grows while all keys inside
+    # it are reconstructed within the tolerances (distance for positions, per component
+    # for scales, radians for rotations) by lerp, and slerp for rotations; returns a bool
+    # mask of the keys to keep, the first and last are always kept
+    frames = np.asarray(frames, np.float64)
+    positions = np.asarray(positions, np.float64)
+    scales = np.asarray(scales, np.float64)
+    rotations = np.asarray(rotations, np.float64)
+    count = len(frames)
+    keep = np.zeros(count, bool)
+    keep[:1] = keep[-1:] = True
+
+    def fits(a, b):
+        t = (frames[a+1:b] - frames[a]) / (frames[b] - frames[a])
+        p = positions[a] + t[:, None] * (positions[b] - positions[a])
+        if (np.linalg.norm(p - positions[a+1:b], axis=1) > position_tolerance).any():
+            return False
+        s = scales[a] + t[:, None] * (scales[b] - scales[a])
+        if (np.abs(s - scales[a+1:b]) > scale_tolerance).any():
+            return False
+        q = slerp(rotations[a], rotations[b], t)
+        dot = np.abs((q * rotations[a+1:b]).sum(axis=1))
+        return not (2 * np.arccos(np.minimum(dot, 1.0)) > rotation_tolerance).any()
+
+    # every segment reaches as far as a gallop then bisection finds, only
+    # segments that were checked are kept so the tolerances always hold
+    anchor = 0
+    while anchor < count-1:
+        good, step = anchor+1, 1
+        while good+step < count and fits(anchor, good+step):
+            good += step
+            step *= 2
+        bad = min(good+step, count)
+        while bad-good > 1:
+            middle = (good+bad) // 2
+            if fits(anchor, middle):
+                good = middle
+            else:
+                bad = middle
+        keep[good] = True
+        anchor = good
+    return keep
+
+def slerp(q0, q1, t):
+    # unit quaternions q0, q1 at every t, along the shorter arc
+    d = np.dot(q0, q1)
+    if d < 0:
+        q1, d = -q1, -d
+    if d > 0.9995:
+        q = q0 + t[:, None] * (q1 - q0)
+        return q / np.linalg.norm(q, axis=1)[:, None]
+    theta = np.arccos(d)
+    return (np.sin((1 - t) * theta)[:, None] * q0 + np.sin(t * theta)[:, None] * q1) / np.sin(theta)
+
+def decompose(matrices):
+    # translation, scale and (w, x, y, z) rotation of (..., 4, 4) matrices the way
+    # mathutils' to_translation, to_scale and to_quaternion compute them: scale is
+    # the column lengths, the rotation comes from the column-normalized 3x3
+    matrices = np.asarray(matrices, np.float64)
+    loc = matrices[..., :3, 3].copy()
+    sca = np.linalg.norm(matrices[..., :3, :3], axis=-2)
+    m = matrices[..., :3, :3] / np.where(sca, sca, 1.0)[..., None, :]
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    rot = np.empty(m.shape[:-2] + (4,))
+
+    # the branch with the largest diagonal term keeps the square root well away from zero
+    trace = 0.25 * (1 + m00 + m11 + m22)
+    cases = [trace > 1e-4]
+    cases.append(~cases[0] & (m00 > m11) & (m00 > m22))
+    cases.append(~cases[0] & ~cases[1] & (m11 > m22))
+    cases.append(~cases[0] & ~cases[1] & ~cases[2])
+
+    # one component comes from the square root, the other three from off-diagonal sums
+    for axis, (case, signs) in enumerate(zip(cases, ((1, 1, 1), (1, -1, -1), (-1, 1, -1), (-1, -1, 1)))):
+        if not case.any():
+            continue
+        c = m[case]
+        s = 2 * np.sqrt(np.maximum(1 + signs[0]*c[:, 0, 0] + signs[1]*c[:, 1, 1] + signs[2]*c[:, 2, 2], 0))
+        dx, dy, dz = (c[:, 2, 1] - c[:, 1, 2]) / s, (c[:, 0, 2] - c[:, 2, 0]) / s, (c[:, 1, 0] - c[:, 0, 1]) / s
+        xy, xz, yz = (c[:, 1, 0] + c[:, 0, 1]) / s, (c[:, 0, 2] + c[:, 2, 0]) / s, (c[:, 2, 1] + c[:, 1, 2]) / s
+        rot[case] = np.stack(((s/4, dx, dy, dz), (dx, s/4, xy, xz), (dy, xy, s/4, yz), (dz, xz, yz, s/4))[axis], axis=-1)
+    rot /= np.linalg.norm(rot, axis=-1)[..., None]
+    return loc, sca, rot
+
+def compose(loc, rot, sca, rotation_mode='QUATERNION'):
+    # (..., 4, 4) matrices from translations, rotations and scales like a pose bone's
+    # matrix_basis: rot is (w, x, y, z) for 'QUATERNION', (angle, x, y, z) for
+    # 'AXIS_ANGLE', and euler angles for the orders 'XYZ' to 'ZYX' (first axis applied first)
+    loc, rot, sca = (np.asarray(a, np.float64) for a in (loc, rot, sca))
+    if rotation_mode == 'AXIS_ANGLE':
+        length = np.linalg.norm(rot[..., 1:], axis=-1)
+        half = np.where(length, rot[..., 0], 0) / 2
+        rot = np.concatenate((np.cos(half)[..., None], np.sin(half)[..., None] * rot[..., 1:] / np.where(length, length, 1)[..., None]), axis=-1)
+        rotation_mode = 'QUATERNION'
+    if rotation_mode == 'QUATERNION':
+        length = np.linalg.norm(rot, axis=-1)
+        w, x, y, z = np.moveaxis(np.where(length[..., None] > 0, rot / np.where(length, length, 1)[..., None], (1, 0, 0, 0)), -1, 0)
+        r = np.stack((np.stack((1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)), -1),
+                      np.stack((2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)), -1),
+                      np.stack((2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)), -1)), -2)
+    else:
+        r = np.broadcast_to(np.eye(3), rot.shape[:-1] + (3, 3))
+        for axis in rotation_mode:
+            i = 'XYZ'.index(axis)
+            c, s = np.cos(rot[..., i]), np.sin(rot[..., i])
+            j, k = (i+1) % 3, (i+2) % 3
+            step = np.zeros(rot.shape[:-1] + (3, 3))
+            step[..., i, i] = 1
+            step[..., j, j] = step[..., k, k] = c
+            step[..., k, j], step[..., j, k] = s, -s
+            r = step @ r
+    m = np.zeros(r.shape[:-2] + (4, 4))
+    m[..., :3, :3] = r * sca[..., None, :]
+    m[..., :3, 3] = loc
+    m[..., 3, 3] = 1
+    return m
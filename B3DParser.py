@@ -2,29 +2,213 @@
 # by Joric, https://github.com/joric/io_scene_b3d
 
 import os
+import mmap
+import time
 import struct
 
-class B3DParser:
-    def __init__(self):
-        self.fp = None
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class FileReader:
+    def __init__(self, filepath):
+        self.fp = open(filepath,'rb')
+        self.read = self.fp.read
+        self.tell = self.fp.tell
+        self.seek = self.fp.seek
+
+    def unpack(self, fmt, size):
+        return struct.unpack(fmt, self.fp.read(size))
 
     def gets(self):
-        s = b''
+        pos = self.fp.tell()
+        blocks = []
         while True:
-            c = self.fp.read(1)
-            if c == b'\x00':
+            block = self.fp.read(64)
+            end = block.find(b'\x00')
+            if end >= 0 or not block:
+                blocks.append(block[:end] if end >= 0 else block)
+                s = b''.join(blocks)
+                self.fp.seek(pos + len(s) + 1)
                 return s.decode(errors='ignore')
-            s += c
+            blocks.append(block)
+
+    def close(self):
+        self.fp.close()
+
+
+class BufferReader:
+    # cursor over bytes or a mapping, read() returns zero-copy memoryviews
+    def __init__(self, data):
+        self.mm = data
+        self.buf = memoryview(data)
+        self.pos = 0
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def read(self, size):
+        pos = self.pos
+        self.pos += size
+        return self.buf[pos:self.pos]
+
+    def unpack(self, fmt, size):
+        pos = self.pos
+        self.pos += size
+        return struct.unpack_from(fmt, self.buf, pos)
+
+    def gets(self):
+        s, self.pos = cstring(self.mm, self.pos)
+        return s
+
+    def close(self):
+        # views handed out by read() keep the mapping alive until released
+        self.buf = self.mm = None
+
+
+class MappedReader(BufferReader):
+    def __init__(self, filepath):
+        with open(filepath,'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            BufferReader.__init__(self, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if size else b'')
+
+
+class BytesStream:
+    # StreamReader-like source over bytes, readexactly() returns zero-copy memoryviews
+    def __init__(self, data):
+        self.data = data if hasattr(data, 'find') else bytes(data)
+        self.view = memoryview(self.data)
+        self.pos = 0
+
+    async def readexactly(self, n):
+        import asyncio
+        data = self.view[self.pos:self.pos+n]
+        self.pos += len(data)
+        if len(data) < n:
+            raise asyncio.IncompleteReadError(bytes(data), n)
+        return data
+
+    async def readuntil(self, separator):
+        import asyncio
+        end = self.data.find(separator, self.pos)
+        if end < 0:
+            data = self.data[self.pos:]
+            self.pos = len(self.data)
+            raise asyncio.IncompleteReadError(bytes(data), None)
+        data = self.data[self.pos:end+len(separator)]
+        self.pos = end+len(separator)
+        return data
+
+    def close(self):
+        self.data = self.view = None
+
+
+class FileStream:
+    # StreamReader-like source over a file, blocking reads of at least 64K run in
+    # an executor (None is the loop's default, bounded thread pool)
+    def __init__(self, filepath, executor=None):
+        self.fp = open(filepath, 'rb')
+        self.executor = executor
+        self.buffer = b''
+        self.pos = 0
+
+    async def fill(self, n):
+        # reads until n bytes are buffered, returns False at end of file
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while len(self.buffer) - self.pos < n:
+            block = await loop.run_in_executor(self.executor, self.fp.read, max(n - len(self.buffer) + self.pos, 1<<16))
+            if not block:
+                return False
+            self.buffer = self.buffer[self.pos:] + block
+            self.pos = 0
+        return True
+
+    async def readexactly(self, n):
+        import asyncio
+        if not await self.fill(n):
+            data, self.buffer, self.pos = self.buffer[self.pos:], b'', 0
+            raise asyncio.IncompleteReadError(data, n)
+        data = self.buffer[self.pos:self.pos+n]
+        self.pos += n
+        return data
+
+    async def readuntil(self, separator):
+        import asyncio
+        while True:
+            end = self.buffer.find(separator, self.pos)
+            if end >= 0:
+                data = self.buffer[self.pos:end+len(separator)]
+                self.pos = end+len(separator)
+                return data
+            if not await self.fill(len(self.buffer) - self.pos + 1):
+                data, self.buffer, self.pos = self.buffer[self.pos:], b'', 0
+                raise asyncio.IncompleteReadError(data, None)
+
+    def close(self):
+        self.fp.close()
+
+
+class ChunkProfile:
+    # per chunk tag: count, payload bytes, decode time, largest chunk and its offset
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, chunk, pos, size, seconds):
+        stat = self.stats.get(chunk)
+        if stat is None:
+            stat = self.stats[chunk] = dotdict({'count':0, 'bytes':0, 'time':0.0, 'largest':-1, 'offset':-1})
+        stat.count += 1
+        stat.bytes += size
+        stat.time += seconds
+        if size > stat.largest:
+            stat.largest = size
+            stat.offset = pos
+
+    def as_dict(self):
+        return {chunk: dict(stat) for chunk, stat in self.stats.items()}
+
+    def __str__(self):
+        lines = ['chunk    count        bytes    time ms      MB/s      largest    at offset']
+        for chunk, stat in sorted(self.stats.items(), key=lambda x: -x[1].time):
+            rate = stat.bytes / stat.time / 1e6 if stat.time else 0.0
+            lines.append('%-5s %8d %12d %10.3f %9.1f %12d %12d' % (chunk, stat.count, stat.bytes,
+                stat.time*1000, rate, stat.largest, stat.offset))
+        return '\n'.join(lines)
+
+
+class B3DParser:
+    def __init__(self, tuples=False, use_mmap=False, profile=False, skip=None):
+        self.fp = None
+        # tuples=True keeps the legacy tuple-of-tuples output
+        self.tuples = tuples or np is None
+        self.reader = MappedReader if use_mmap else FileReader
+        # profile=True (or a ChunkProfile to accumulate into) times every chunk
+        self.profile = ChunkProfile() if profile is True else profile or None
+        # skip is a set of chunk tags, or a predicate(tag, path) where path is the tuple
+        # of enclosing node names; skipped chunks and their children are passed with a seek
+        self.skip = skip
+
+    def gets(self):
+        return self.fp.gets()
 
     def i(self,n):
-        return struct.unpack(n*'i', self.fp.read(n*4))
+        return self.fp.unpack(n*'i', n*4)
 
     def f(self,n):
-        return struct.unpack(n*'f', self.fp.read(n*4))
+        return self.fp.unpack(n*'f', n*4)
+
+    def records(self, dtype, end):
+        buf = self.fp.read(end - self.fp.tell())
+        return np.frombuffer(buf, dtype, len(buf) // dtype.itemsize)
 
     def next_chunk(self):
         pos = self.fp.tell()
-        s1,s2,s3,s4, size = struct.unpack('4ci', self.fp.read(8))
+        s1,s2,s3,s4, size = self.fp.unpack('4ci', 8)
         chunk = ''.join([chr(ord(x)) for x in (s1,s2,s3,s4)])
         next = pos + size + 8
         return chunk, pos, size, next
@@ -32,111 +216,505 @@ class B3DParser:
     def cb_result(self):
         return True
 
-    def parse(self, filepath):
-        filesize = os.stat(filepath).st_size
-        self.fp = open(filepath,'rb')
-        stack = []
-        while self.fp.tell() <= filesize-8:
+    def cb_skip(self, chunk, data):
+        pass
 
-            while stack and stack[-1]==self.fp.tell():
-                del stack[-1]
-                self.cb_prev()
+    def read_data(self, chunk, next):
+        if chunk=='BB3D':
+            return {'version': self.i(1)[0]}
 
-            chunk, pos, size, next = self.next_chunk()
+        elif chunk=='ANIM':
+            flags, frames = self.i(2)
+            fps = self.f(1)[0]
+            return {'flags':flags, 'frames':frames, 'fps':fps}
 
-            if chunk=='BB3D':
-                self.cb_data(chunk, {'version': self.i(1)[0]})
-                continue
+        elif chunk=='TEXS':
+            # the payload is read once and names are located with find()
+            buf = bytes(self.fp.read(next - self.fp.tell()))
+            data = []
+            pos = 0
+            while pos < len(buf):
+                name, pos = cstring(buf, pos)
+                flags, blend, x, y, sx, sy, rot = struct.unpack_from('2i5f', buf, pos)
+                pos += 28
+                data.append(dotdict({'name':name,'position':(x,y),'scale':(sx,sy),'rotation':rot}))
+            return {'textures':data}
 
-            if chunk=='ANIM':
-                flags, frames = self.i(2)
-                fps = self.f(1)[0]
-                self.cb_data(chunk, {'flags':flags, 'frames':frames, 'fps':fps})
+        elif chunk=='BRUS':
+            n_texs = self.i(1)[0]
+            brus = struct.Struct('5f2i%di' % n_texs)
+            buf = bytes(self.fp.read(next - self.fp.tell()))
+            data = []
+            pos = 0
+            while pos < len(buf):
+                name, pos = cstring(buf, pos)
+                values = brus.unpack_from(buf, pos)
+                pos += brus.size
+                data.append(dotdict({'name':name, 'rgba':values[:4],'shine':values[4],
+                    'blend':values[5],'fx':values[6],'tids':values[7:]}))
+            return {'materials':data}
 
-            elif chunk=='TEXS':
-                data = []
-                while self.fp.tell()<next:
-                    name = self.gets()
-                    flags, blend = self.i(2)
-                    pos = self.f(2)
-                    scale = self.f(2)
-                    rot = self.f(1)[0]
-                    data.append(dotdict({'name':name,'position':pos,'scale':scale,'rotation':rot}))
-                self.cb_data(chunk,{'textures':data})
-
-            elif chunk=='BRUS':
-                n_texs = self.i(1)[0]
-                data = []
-                while self.fp.tell()<next:
-                    name = self.gets()
-                    rgba = self.f(4)
-                    shine = self.f(1)[0]
-                    blend, fx = self.i(2)
-                    tids = self.i(n_texs)
-                    data.append(dotdict({'name':name, 'rgba':rgba,'shine':shine, 'blend':blend,'fx':fx,'tids':tids}))
-                self.cb_data(chunk, {'materials':data})
-
-            elif chunk=='NODE':
-                self.cb_next()
-                stack.append(next)
-                name = self.gets()
-                p = self.f(3)
-                s = self.f(3)
-                r = self.f(4)
-                self.cb_data(chunk, {'name':name, 'position':p, 'rotation':r, 'scale':s})
-                continue
+        elif chunk=='NODE':
+            name = self.gets()
+            p = self.f(3)
+            s = self.f(3)
+            r = self.f(4)
+            return {'name':name, 'position':p, 'rotation':r, 'scale':s}
 
-            elif chunk=='BONE':
-                bones = []
-                while self.fp.tell()<next:
-                    vertex_id = self.i(1)[0]
-                    weight = self.f(1)[0]
-                    bones.append((vertex_id, weight))
-                self.cb_data(chunk,{'bones': bones})
-
-            elif chunk=='MESH':
-                self.cb_data(chunk, {'brush_id': self.i(1)[0]})
-                #self.cb_next()
-                #stack.append(next)
-                continue
+        elif chunk=='MESH':
+            return {'brush_id': self.i(1)[0]}
 
-            elif chunk=='VRTS':
-                flags, tcs, tcss = self.i(3)
+        elif chunk in record_chunks:
+            header, stride = self.read_header(chunk)
+            return self.read_body(chunk, header, next)
+
+    # VRTS, TRIS, BONE and KEYS are a header followed by fixed-stride records
+    def read_header(self, chunk):
+        if chunk=='VRTS':
+            flags, tcs, tcss = self.i(3)
+            return (flags, tcs, tcss), vrts_stride(flags, tcs, tcss)
+        elif chunk=='TRIS':
+            return self.i(1)[0], 12
+        elif chunk=='BONE':
+            return None, 8
+        elif chunk=='KEYS':
+            flags = self.i(1)[0]
+            return flags, keys_stride(flags)
+
+    def read_body(self, chunk, header, end):
+        if chunk=='BONE':
+            if not self.tuples:
+                bone = self.records(bone_dtype, end)
+                return {'bones': (bone['vertex_id'], bone['weight'])}
+            bones = []
+            while self.fp.tell()<end:
+                vertex_id = self.i(1)[0]
+                weight = self.f(1)[0]
+                bones.append((vertex_id, weight))
+            return {'bones': bones}
+
+        elif chunk=='VRTS':
+            flags, tcs, tcss = header
+            if self.tuples:
                 v,n,c,u = [],[],[],[]
-                while self.fp.tell()<next:
+                while self.fp.tell()<end:
                     v.append(self.f(3))
                     if flags & 1: n.append(self.f(3))
                     if flags & 2: c.append(self.f(4))
                     if tcs*tcss: u.append(self.f(tcs*tcss))
-                self.cb_data(chunk, {'vertices':v, 'normals':n, 'rgba':c, 'uvs':u})
+            else:
+                vrts = self.records(vrts_dtype(flags, tcs, tcss), end)
+                v = vrts['position']
+                n = field(vrts, 'normal', (3,))
+                c = field(vrts, 'color', (4,))
+                u = field(vrts, 'uv', (tcs, tcss))
+            return {'vertices':v, 'normals':n, 'rgba':c, 'uvs':u}
 
-            elif chunk=='TRIS':
-                brush_id = self.i(1)[0]
-                faces = []
-                while self.fp.tell()<next:
-                    vertex_id = self.i(3)
-                    faces.append(vertex_id)
-                self.cb_data(chunk, {'brush_id':brush_id, 'indices':faces})
+        elif chunk=='TRIS':
+            if not self.tuples:
+                return {'brush_id':header, 'indices':self.records(tris_dtype, end)['indices']}
+            faces = []
+            while self.fp.tell()<end:
+                vertex_id = self.i(3)
+                faces.append(vertex_id)
+            return {'brush_id':header, 'indices':faces}
 
-            elif chunk=='KEYS':
-                flags = self.i(1)[0]
-                keys = []
-                while self.fp.tell()<next:
-                    key = dotdict({'frame':self.i(1)[0]})
-                    if flags & 1: key['position'] = self.f(3)
-                    if flags & 2: key['scale'] = self.f(3)
-                    if flags & 4: key['rotation'] = self.f(4)
-                    keys.append(key)
-                self.cb_data(chunk, keys)
-
-            self.fp.seek(next)
+        elif chunk=='KEYS':
+            flags = header
+            if not self.tuples:
+                keys = self.records(keys_dtype(flags), end)
+                return dotdict({'flags':flags, 'frames':keys['frame'],
+                    'positions':field(keys, 'position', (3,)),
+                    'scales':field(keys, 'scale', (3,)),
+                    'rotations':field(keys, 'rotation', (4,))})
+            keys = []
+            while self.fp.tell()<end:
+                key = dotdict({'frame':self.i(1)[0]})
+                if flags & 1: key['position'] = self.f(3)
+                if flags & 2: key['scale'] = self.f(3)
+                if flags & 4: key['rotation'] = self.f(4)
+                keys.append(key)
+            return keys
+
+    # yields ('enter', 'NODE', data), ('data', chunk, data) and ('leave', 'NODE', None),
+    # with batch=N record chunks arrive as several events of at most N records,
+    # chunks excluded by skip arrive as ('skip', chunk, {'offset', 'size'})
+    def iter_events(self, filepath, batch=None):
+        filesize = os.stat(filepath).st_size
+        self.fp = self.reader(filepath)
+        profile = self.profile
+        skip = self.skip
+        stack = []
+        names = []
+        try:
+            while self.fp.tell() <= filesize-8:
+
+                while stack and stack[-1]==self.fp.tell():
+                    del stack[-1]
+                    del names[-1]
+                    yield 'leave', 'NODE', None
+
+                chunk, pos, size, next = self.next_chunk()
+                if size < 0:
+                    raise ValueError('%s chunk at %d has negative size %d' % (chunk, pos, size))
+
+                if skip is not None and (skip(chunk, tuple(names)) if callable(skip) else chunk in skip):
+                    self.fp.seek(next)
+                    yield 'skip', chunk, {'offset':pos, 'size':size}
+                    continue
+
+                if profile is not None:
+                    start = time.perf_counter()
+
+                if chunk=='NODE':
+                    stack.append(next)
+                    data = self.read_data(chunk, next)
+                    names.append(data['name'])
+                    if profile is not None:
+                        profile.add(chunk, pos, self.fp.tell()-pos-8, time.perf_counter()-start)
+                    yield 'enter', chunk, data
+                    continue
+
+                elif batch and chunk in record_chunks:
+                    header, stride = self.read_header(chunk)
+                    elapsed = 0.0
+                    # a size running past the file or the parent node stops there
+                    limit = min([next, filesize] + stack[-1:])
+                    while True:
+                        end = min(limit, self.fp.tell() + batch*stride)
+                        data = self.read_body(chunk, header, end)
+                        if profile is not None:
+                            elapsed += time.perf_counter()-start
+                        yield 'data', chunk, data
+                        if profile is not None:
+                            start = time.perf_counter()
+                        # a short read (truncated file, partial record) ends the chunk
+                        if end >= limit or self.fp.tell() < end:
+                            break
+                    if profile is not None:
+                        profile.add(chunk, pos, size, elapsed)
+
+                else:
+                    data = self.read_data(chunk, next)
+                    if profile is not None:
+                        container = chunk in ('BB3D', 'MESH')
+                        profile.add(chunk, pos, self.fp.tell()-pos-8 if container else size,
+                                    time.perf_counter()-start)
+                    if data is not None:
+                        yield 'data', chunk, data
+
+                # container chunks continue with their children
+                if chunk not in ('BB3D', 'MESH'):
+                    self.fp.seek(next)
+
+            for _ in stack:
+                yield 'leave', 'NODE', None
+        finally:
+            self.fp.close()
+
+    # walks chunk headers only and returns every structural problem
+    # as a sorted list of (offset, chunk, message)
+    def validate(self, filepath):
+        filesize = os.stat(filepath).st_size
+        if filesize < 12:
+            return [(0, None, 'empty file' if not filesize else
+                     'only %d bytes, too short for a BB3D header' % filesize)]
+        self.fp = self.reader(filepath)
+        errors = []
+        brushes = []  # (offset, chunk, brush_id) from MESH and TRIS
+        textures = [] # (offset, texture_id) from BRUS
+        n_brushes = n_textures = 0
+        stack = [(filesize, None)]
+        try:
+            while True:
+                pos = self.fp.tell()
+                while len(stack)>1 and stack[-1][0]<=pos:
+                    del stack[-1]
+                end, parent = stack[-1]
+                if pos >= end:
+                    break
+                if end-pos < 8:
+                    errors.append((pos, parent, '%d stray bytes, too short for a chunk header' % (end-pos)))
+                    self.fp.seek(end)
+                    continue
+
+                chunk, pos, size, next = self.next_chunk()
+                if not all('A' <= c <= 'Z' or '0' <= c <= '9' for c in chunk):
+                    errors.append((pos, repr(chunk), 'invalid chunk tag, skipping the rest of %s' % (parent or 'the file')))
+                    self.fp.seek(end)
+                    continue
+                if size < 0:
+                    errors.append((pos, chunk, 'negative size %d' % size))
+                    self.fp.seek(end)
+                    continue
+                if next > end:
+                    errors.append((pos, chunk, 'ends at %d, past the end of %s at %d' % (next, parent or 'the file', end)))
+                    next = end
+                    size = next-pos-8
+
+                if pos == 0 and chunk != 'BB3D':
+                    errors.append((pos, chunk, 'file does not start with a BB3D chunk'))
+                elif parent is None and chunk not in chunk_parents:
+                    errors.append((pos, chunk, 'unknown chunk at the top level'))
+                if chunk in chunk_parents and parent not in chunk_parents[chunk]:
+                    errors.append((pos, chunk, 'inside %s, expected in %s' % (parent or 'the file', ' or '.join(x or 'the file' for x in chunk_parents[chunk]))))
+
+                minimum = {'BB3D':4, 'MESH':4, 'ANIM':12, 'VRTS':12, 'TRIS':4, 'KEYS':4, 'BRUS':4}.get(chunk, 0)
+                if size < minimum:
+                    errors.append((pos, chunk, 'size %d is too small, need at least %d' % (size, minimum)))
+                    self.fp.seek(next)
+                    continue
+
+                if chunk=='BB3D':
+                    self.fp.seek(pos+12)
+                    stack.append((next, chunk))
+                    continue
+
+                elif chunk=='NODE':
+                    name_end = self.find_nul(pos+8, next)
+                    if name_end < 0:
+                        errors.append((pos, chunk, 'name is not terminated'))
+                    elif name_end+41 > next:
+                        errors.append((pos, chunk, 'transform is truncated'))
+                    else:
+                        self.fp.seek(name_end+41)
+                        stack.append((next, chunk))
+                        continue
+
+                elif chunk=='MESH':
+                    brushes.append((pos, chunk, self.i(1)[0]))
+                    stack.append((next, chunk))
+                    continue
+
+                elif chunk=='VRTS':
+                    flags, tcs, tcss = self.i(3)
+                    if not 0 <= tcs <= 8 or not 0 <= tcss <= 4:
+                        errors.append((pos, chunk, 'bad texture coordinate layout %d sets of %d' % (tcs, tcss)))
+                    elif (size-12) % vrts_stride(flags, tcs, tcss):
+                        errors.append((pos, chunk, 'payload of %d bytes is not a multiple of the %d byte vertex' % (size-12, vrts_stride(flags, tcs, tcss))))
+
+                elif chunk=='TRIS':
+                    brushes.append((pos, chunk, self.i(1)[0]))
+                    if (size-4) % 12:
+                        errors.append((pos, chunk, 'payload of %d bytes is not a multiple of the 12 byte triangle' % (size-4)))
+
+                elif chunk=='BONE':
+                    if size % 8:
+                        errors.append((pos, chunk, 'payload of %d bytes is not a multiple of the 8 byte weight' % size))
+
+                elif chunk=='KEYS':
+                    flags = self.i(1)[0]
+                    if flags & ~7:
+                        errors.append((pos, chunk, 'unknown key flags %d' % flags))
+                    elif (size-4) % keys_stride(flags):
+                        errors.append((pos, chunk, 'payload of %d bytes is not a multiple of the %d byte key' % (size-4, keys_stride(flags))))
+
+                elif chunk=='TEXS':
+                    buf = bytes(self.fp.read(size))
+                    at = 0
+                    while at < len(buf):
+                        at = buf.find(b'\x00', at)
+                        if at < 0 or at+29 > len(buf):
+                            errors.append((pos, chunk, 'texture %d is truncated' % n_textures))
+                            break
+                        at += 29
+                        n_textures += 1
+
+                elif chunk=='BRUS':
+                    n_texs = self.i(1)[0]
+                    if not 0 <= n_texs <= 8:
+                        errors.append((pos, chunk, 'bad texture count %d' % n_texs))
+                    else:
+                        buf = bytes(self.fp.read(size-4))
+                        at = 0
+                        while at < len(buf):
+                            at = buf.find(b'\x00', at)
+                            if at < 0 or at+29+4*n_texs > len(buf):
+                                errors.append((pos, chunk, 'brush %d is truncated' % n_brushes))
+                                break
+                            tids = struct.unpack_from('%di' % n_texs, buf, at+29)
+                            textures.extend((pos+12+at+29, tid) for tid in tids)
+                            at += 29+4*n_texs
+                            n_brushes += 1
+
+                self.fp.seek(next)
 
+            for pos, chunk, brush_id in brushes:
+                if not -1 <= brush_id < n_brushes:
+                    errors.append((pos, chunk, 'brush %d out of range, %d brushes' % (brush_id, n_brushes)))
+            for pos, texture_id in textures:
+                if not -1 <= texture_id < n_textures:
+                    errors.append((pos, 'BRUS', 'texture %d out of range, %d textures' % (texture_id, n_textures)))
+        finally:
+            self.fp.close()
+
+        return sorted(errors, key=lambda e: e[0])
+
+    def find_nul(self, start, end):
+        self.fp.seek(start)
+        while start < end:
+            block = bytes(self.fp.read(min(end-start, 4096)))
+            if not block:
+                break
+            at = block.find(b'\x00')
+            if at >= 0:
+                return start+at
+            start += len(block)
+        return -1
+
+    def parse(self, filepath):
+        for event, chunk, data in self.iter_events(filepath):
+            if event=='enter':
+                self.cb_next()
+                self.cb_data(chunk, data)
+            elif event=='leave':
+                self.cb_prev()
+            elif event=='skip':
+                self.cb_skip(chunk, data)
+            else:
+                self.cb_data(chunk, data)
+        return self.cb_result()
+
+    # asyncio counterpart of iter_events for an asyncio.StreamReader, bytes or a file path
+    # (read in the loop's executor). Every chunk payload is awaited whole and decoded from
+    # memory, and the loop gets control back after each chunk, so a cancelled task stops
+    # between chunks. Batching and profiling are not supported here.
+    async def iter_events_async(self, source):
+        import asyncio
+        if isinstance(source, str):
+            stream = FileStream(source)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            stream = BytesStream(source)
+        else:
+            stream = source
+        skip = self.skip
+        stack = [] # (end, tag) of the open BB3D, NODE and MESH chunks
+        names = []
+        pos = 0
+        try:
+            while True:
+                while stack and stack[-1][0]<=pos:
+                    if stack.pop()[1]=='NODE':
+                        del names[-1]
+                        yield 'leave', 'NODE', None
+
+                try:
+                    tag, size = struct.unpack('<4si', await stream.readexactly(8))
+                except asyncio.IncompleteReadError:
+                    break
+                chunk = tag.decode('latin-1')
+                if size < 0:
+                    raise ValueError('%s chunk at %d has negative size %d' % (chunk, pos, size))
+                start, next = pos, pos + size + 8
+
+                if skip is not None and (skip(chunk, tuple(names)) if callable(skip) else chunk in skip):
+                    while size > 0:
+                        size -= len(await stream.readexactly(min(size, 1<<20)))
+                    pos = next
+                    yield 'skip', chunk, {'offset':start, 'size':next-start-8}
+                    continue
+
+                if chunk=='NODE':
+                    payload = bytes(await stream.readuntil(b'\x00')) + bytes(await stream.readexactly(40))
+                elif chunk in ('BB3D', 'MESH'):
+                    payload = await stream.readexactly(4)
+                else:
+                    payload = await stream.readexactly(size)
+
+                self.fp = BufferReader(payload)
+                data = self.read_data(chunk, len(payload))
+                self.fp = None
+
+                if chunk in ('BB3D', 'NODE', 'MESH'):
+                    pos += 8 + len(payload)
+                    stack.append((next, chunk))
+                else:
+                    pos = next
+
+                await asyncio.sleep(0)
+                if chunk=='NODE':
+                    names.append(data['name'])
+                    yield 'enter', chunk, data
+                elif data is not None:
+                    yield 'data', chunk, data
+
+            for end, chunk in stack:
+                if chunk=='NODE':
+                    yield 'leave', 'NODE', None
+        finally:
+            if stream is not source:
+                stream.close()
+
+    async def parse_async(self, source):
+        async for event, chunk, data in self.iter_events_async(source):
+            if event=='enter':
+                self.cb_next()
+                self.cb_data(chunk, data)
+            elif event=='leave':
+                self.cb_prev()
+            elif event=='skip':
+                self.cb_skip(chunk, data)
+            else:
+                self.cb_data(chunk, data)
         return self.cb_result()
 
 
+record_chunks = ('VRTS', 'TRIS', 'BONE', 'KEYS')
+
+# where each known chunk may appear, None is the top level of the file
+chunk_parents = {'BB3D':(None,), 'TEXS':('BB3D',), 'BRUS':('BB3D',), 'NODE':('BB3D', 'NODE'),
+    'MESH':('NODE',), 'BONE':('NODE',), 'KEYS':('NODE',), 'ANIM':('NODE',),
+    'VRTS':('MESH',), 'TRIS':('MESH',)}
+
+def cstring(buf, pos):
+    end = buf.find(b'\x00', pos)
+    if end < 0:
+        end = len(buf)
+    return buf[pos:end].decode(errors='ignore'), end+1
+
+def vrts_stride(flags, tcs, tcss):
+    return 4*(3 + (3 if flags & 1 else 0) + (4 if flags & 2 else 0) + tcs*tcss)
+
+def keys_stride(flags):
+    return 4*(1 + (3 if flags & 1 else 0) + (3 if flags & 2 else 0) + (4 if flags & 4 else 0))
+
+def vrts_dtype(flags, tcs, tcss):
+    fields = [('position', '<f4', (3,))]
+    if flags & 1: fields.append(('normal', '<f4', (3,)))
+    if flags & 2: fields.append(('color', '<f4', (4,)))
+    if tcs*tcss: fields.append(('uv', '<f4', (tcs, tcss)))
+    return np.dtype(fields)
+
+def keys_dtype(flags):
+    fields = [('frame', '<i4')]
+    if flags & 1: fields.append(('position', '<f4', (3,)))
+    if flags & 2: fields.append(('scale', '<f4', (3,)))
+    if flags & 4: fields.append(('rotation', '<f4', (4,)))
+    return np.dtype(fields)
+
+if np:
+    tris_dtype = np.dtype([('indices', '<i4', (3,))])
+    bone_dtype = np.dtype([('vertex_id', '<i4'), ('weight', '<f4')])
+
+def field(records, name, shape):
+    if name in records.dtype.names:
+        return records[name]
+    return np.empty((0,)+shape, np.float32)
+
+
+def iter_events(filepath, batch=None, **kwargs):
+    return B3DParser(**kwargs).iter_events(filepath, batch)
+
+def validate(filepath, **kwargs):
+    return B3DParser(**kwargs).validate(filepath)
+
+def iter_events_async(source, **kwargs):
+    return B3DParser(**kwargs).iter_events_async(source)
+
+
 class B3DDebugParser(B3DParser):
-    def __init__(self):
-        B3DParser.__init__(self)
+    def __init__(self, **kwargs):
+        B3DParser.__init__(self, **kwargs)
         self.level = 0
 
     def cb_next(self):
@@ -155,9 +733,26 @@ class dotdict(dict):
     __setattr__ = dict.__setitem__
 
 
+def store(node, chunk, data):
+    if chunk in ['NODE','MESH','VRTS','BONE']:
+        node.update(data)
+    elif chunk=='TRIS':
+        if 'faces' not in node:
+            node.faces = []
+        node.faces.append(dotdict(data))
+    elif chunk=='KEYS':
+        if 'keys' not in node:
+            node['keys'] = []
+        # array mode keeps one set of columns per KEYS chunk
+        if isinstance(data, list):
+            node['keys'].extend(data)
+        else:
+            node['keys'].append(data)
+
+
 class B3DList(B3DParser):
-    def __init__(self):
-        B3DParser.__init__(self)
+    def __init__(self, **kwargs):
+        B3DParser.__init__(self, **kwargs)
         self.index = -1
         self.data = dotdict()
         self.data.nodes = []
@@ -172,29 +767,67 @@ class B3DList(B3DParser):
         self.index = self.data.nodes[self.index].parent
 
     def cb_data(self, chunk, data):
-        if self.index != -1:
-            node = self.data.nodes[self.index]
-
-        if chunk in ['NODE','MESH','VRTS','BONE']:
-            node.update(data)
-        elif chunk=='TRIS':
-            if 'faces' not in node:
-                node.faces = []
-            node.faces.append(dotdict(data))
-        elif chunk=='KEYS':
-            if 'keys' not in node:
-                node['keys'] = []
-            node['keys'].extend(data)
-        elif chunk in ['ANIM', 'TEXS', 'BRUS']:
+        if chunk in ['ANIM', 'TEXS', 'BRUS']:
             self.data.update(data)
+        elif self.index != -1:
+            store(self.data.nodes[self.index], chunk, data)
+
+    # skipped chunks are listed under 'skipped' of the node (or the file) that holds them
+    def cb_skip(self, chunk, data):
+        target = self.data if chunk in ['ANIM', 'TEXS', 'BRUS'] or self.index == -1 else self.data.nodes[self.index]
+        if 'skipped' not in target:
+            target.skipped = []
+        if chunk not in target.skipped:
+            target.skipped.append(chunk)
 
     def cb_result(self):
         return self.data
 
+    # cache_dir enables the on-disk parse cache, see B3DCache.py
+    def parse(self, filepath, cache_dir=None, cache_size=1<<30, cache_hash=False):
+        # a predicate can't be part of the cache key
+        if cache_dir is None or callable(self.skip):
+            return B3DParser.parse(self, filepath)
+
+        if __package__:
+            from .B3DCache import B3DCache
+        else:
+            from B3DCache import B3DCache
+
+        cache = B3DCache(cache_dir, cache_size, cache_hash)
+        kind = '%s-%s' % (type(self).__name__, 'tuples' if self.tuples else 'arrays')
+        if self.skip:
+            kind += '-skip-' + ','.join(sorted(self.skip))
+        # entries keep the flat node list, so deep trees don't nest in the cache
+        data = cache.load(filepath, kind)
+        if data is None:
+            data = B3DParser.parse(self, filepath)
+            cache.store(filepath, kind, self.flatten(data))
+            return data
+        self.data = data
+        return self.cb_result()
+
+    def flatten(self, data):
+        return data
+
 
 class B3DTree(B3DList):
-    def __init__(self):
-        B3DList.__init__(self)
+    def __init__(self, **kwargs):
+        B3DList.__init__(self, **kwargs)
+
+    def flatten(self, data):
+        # shallow node copies with parent indices instead of children, in walk order
+        nodes = []
+        index = {}
+        for node, depth, parent in walk(data):
+            index[id(node)] = len(nodes)
+            node = dotdict(node)
+            del node['nodes']
+            node.parent = -1 if parent is None else index[id(parent)]
+            nodes.append(node)
+        flat = dotdict(data)
+        flat.nodes = nodes
+        return flat
 
     def cb_result(self):
         tree = []
@@ -213,21 +846,261 @@ class B3DTree(B3DList):
         self.data.update({'nodes':tree})
         return self.data
 
+# node fields decoded on first access and the chunk they come from
+lazy_fields = {'vertices':'VRTS', 'normals':'VRTS', 'rgba':'VRTS', 'uvs':'VRTS',
+    'faces':'TRIS', 'bones':'BONE', 'keys':'KEYS'}
+
+class LazyNode(dotdict):
+    def __init__(self, index, data):
+        dotdict.__init__(self, data)
+        object.__setattr__(self, '_index', index)
+        object.__setattr__(self, '_chunks', [])
+
+    def __getattr__(self, key):
+        return self[key] if key in self else None
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self._pending(key)
+
+    def __missing__(self, key):
+        if self._pending(key):
+            self._index.load(self, lazy_fields[key])
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def _pending(self, key):
+        tag = lazy_fields.get(key)
+        return tag is not None and any(self._index.chunks[c][0]==tag for c in self._chunks)
+
+
+class B3DIndex(B3DParser):
+    # header-only scan: chunks is a table of (tag, pos, size, parent chunk),
+    # nodes carry names, transforms and parent links, payloads load lazily
+    def __init__(self, **kwargs):
+        B3DParser.__init__(self, **kwargs)
+        self.chunks = []
+        self.nodes = []
+        self.tree = []
+        self.names = {}
+
+    def parse(self, filepath):
+        filesize = os.stat(filepath).st_size
+        self.fp = self.reader(filepath)
+        try:
+            self.scan_chunks(filesize)
+        except:
+            self.fp.close()
+            raise
+        return self
+
+    def scan_chunks(self, filesize):
+        stack = []
+        while self.fp.tell() <= filesize-8:
+
+            while stack and stack[-1][0]<=self.fp.tell():
+                del stack[-1]
+
+            chunk, pos, size, next = self.next_chunk()
+            if size < 0:
+                raise ValueError('%s chunk at %d has negative size %d' % (chunk, pos, size))
+            if stack and next > stack[-1][0]:
+                raise ValueError('%s chunk at %d ends at %d, past the end of its parent at %d' % (chunk, pos, next, stack[-1][0]))
+            parent, index = stack[-1][1:] if stack else (-1, -1)
+            self.chunks.append((chunk, pos, size, parent))
+            cid = len(self.chunks)-1
+
+            if chunk=='NODE':
+                node = LazyNode(self, self.read_data(chunk, next))
+                node.parent = index
+                node.nodes = []
+                (self.nodes[index].nodes if index!=-1 else self.tree).append(node)
+                self.names.setdefault(node.name, node)
+                self.nodes.append(node)
+                index = len(self.nodes)-1
+            elif chunk=='MESH' and index!=-1:
+                self.nodes[index].update(self.read_data(chunk, next))
+            elif chunk=='BB3D':
+                self.read_data(chunk, next)
+            else:
+                if index!=-1:
+                    self.nodes[index]._chunks.append(cid)
+                self.fp.seek(next)
+                continue
+
+            stack.append((next, cid, index))
+
+    def node(self, name):
+        return self.names.get(name)
+
+    def read(self, cid):
+        chunk, pos, size, parent = self.chunks[cid]
+        self.fp.seek(pos+8)
+        return self.read_data(chunk, pos+size+8)
+
+    def load(self, node, tag):
+        cids = [cid for cid in node._chunks if self.chunks[cid][0]==tag]
+        node._chunks[:] = [cid for cid in node._chunks if cid not in cids]
+        for cid in cids:
+            store(node, tag, self.read(cid))
+
+    def close(self):
+        self.fp.close()
+
+
+# iterative walk over a parsed tree (B3DTree, B3DModel or B3DIndex result, or a list of
+# root nodes), yields (node, depth, parent) parents first, or children first with post=True
+def walk(root, post=False):
+    stack = [(node, 0, None, False) for node in reversed(root if isinstance(root, list) else root.nodes)]
+    while stack:
+        node, depth, parent, done = stack.pop()
+        if done:
+            yield node, depth, parent
+            continue
+        if post:
+            stack.append((node, depth, parent, True))
+        else:
+            yield node, depth, parent
+        stack.extend((child, depth+1, node, False) for child in reversed(node.nodes))
+
 def dump(node, level=0):
-    for node in node.nodes:
+    for node, depth, parent in walk(node):
         print(node.name)
-        dump(node, level+1)
+
+def find_files(paths):
+    import glob
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith('.b3d'):
+                        yield os.path.join(root, name)
+        elif glob.has_magic(path):
+            for name in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(name):
+                    yield name
+        else:
+            yield path
+
+def alarm(signum, frame):
+    raise TimeoutError('timed out')
+
+def summarize(filepath, timeout=None, profile=False):
+    # one streamed pass, payloads are only counted and never kept
+    record = dotdict({'path':filepath, 'nodes':0, 'vertices':0, 'triangles':0,
+        'bones':0, 'keys':0, 'textures':[]})
+    # one flag per open node, so a BONE chunk streamed in batches counts once
+    has_bone = [False]
+    profile = ChunkProfile() if profile else None
+    start = time.perf_counter()
+    use_alarm = set_alarm(timeout)
+    try:
+        for event, chunk, data in iter_events(filepath, batch=1<<16, profile=profile):
+            if event=='enter':
+                record.nodes += 1
+                has_bone.append(False)
+            elif event=='leave':
+                has_bone.pop()
+            elif chunk=='VRTS':
+                record.vertices += len(data['vertices'])
+            elif chunk=='TRIS':
+                record.triangles += len(data['indices'])
+            elif chunk=='BONE' and not has_bone[-1]:
+                record.bones += 1
+                has_bone[-1] = True
+            elif chunk=='KEYS':
+                record['keys'] += len(data) if isinstance(data, list) else len(data.frames)
+            elif chunk=='TEXS':
+                record.textures.extend(texture.name for texture in data['textures'])
+    except Exception as e:
+        record.error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if use_alarm:
+            set_alarm(0)
+    record.time = round(time.perf_counter() - start, 6)
+    if profile is not None:
+        record.profile = profile.as_dict()
+    return record
+
+def check(filepath, timeout=None):
+    # header-only validation, every violation is listed as [offset, chunk, message]
+    record = dotdict({'path':filepath, 'errors':[]})
+    start = time.perf_counter()
+    use_alarm = set_alarm(timeout)
+    try:
+        record.errors = validate(filepath)
+    except Exception as e:
+        record.error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if use_alarm:
+            set_alarm(0)
+    record.time = round(time.perf_counter() - start, 6)
+    return record
+
+def set_alarm(timeout):
+    import signal
+    if not hasattr(signal, 'setitimer') or timeout is None:
+        return False
+    signal.signal(signal.SIGALRM, alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    return True
+
+def failed(record):
+    return 'error' in record or bool(record.get('errors'))
+
+def scan(paths, workers=None, timeout=None, fail_fast=False, profile=False, validate=False):
+    # yields summaries (or validation reports, which are never profiled) in completion order
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    worker, args = (check, ()) if validate else (summarize, (profile,))
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(worker, path, timeout, *args) for path in find_files(paths)]
+        for future in as_completed(futures):
+            record = future.result()
+            yield record
+            if fail_fast and failed(record):
+                pool.shutdown(wait=False, cancel_futures=True)
+                return
+
+def main(argv=None):
+    import argparse, json, sys
+    parser = argparse.ArgumentParser(prog='B3DParser.py',
+        description='Dump a .b3d file as JSON, or scan files and directories into NDJSON summaries.')
+    parser.add_argument('paths', nargs='+', metavar='path', help='.b3d file, directory or glob')
+    parser.add_argument('--batch', action='store_true', help='summary mode, implied by several paths or a directory')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: cpu count)')
+    parser.add_argument('--timeout', type=float, default=None, help='per-file timeout in seconds')
+    parser.add_argument('--fail-fast', action='store_true', help='stop at the first file that fails')
+    parser.add_argument('--profile', action='store_true', help='per-chunk timings, to stderr or in each summary (ignored with --validate)')
+    parser.add_argument('--validate', action='store_true', help='check chunk headers only and report every violation')
+    parser.add_argument('--skip', default='', metavar='TAGS', help='comma separated chunks to leave out of the dump, e.g. VRTS,TRIS,KEYS')
+    args = parser.parse_args(argv)
+
+    if not args.batch and len(args.paths)==1 and os.path.isfile(args.paths[0]):
+        filepath = args.paths[0]
+        if args.validate:
+            errors = validate(filepath)
+            for offset, chunk, message in errors:
+                print('%s:%d: %s: %s' % (filepath, offset, chunk, message))
+            return 1 if errors else 0
+        #B3DDebugParser().parse(filepath) # text dump
+        #data = B3DList().parse(filepath) # json list
+        parser = B3DTree(profile=args.profile, skip=set(filter(None, args.skip.upper().split(','))) or None)
+        data = parser.parse(filepath) # json tree
+        print(json.dumps(data, indent=1, default=lambda a: a.tolist()))
+        #dump(data)
+        if args.profile:
+            print(parser.profile, file=sys.stderr)
+        return 0
+
+    errors = 0
+    for record in scan(args.paths, args.workers, args.timeout, args.fail_fast, args.profile, args.validate):
+        errors += failed(record)
+        print(json.dumps(record), flush=True)
+    return 1 if errors else 0
 
 if __name__ == '__main__':
     import sys
-    if len(sys.argv)<2:
-        print('Usage: B3DParser.py [filename.b3d]')
-        sys.exit(0)
-    filepath = sys.argv[1]
-    #B3DDebugParser().parse(filepath) # text dump
-    #data = B3DList().parse(filepath) # json list
-    data = B3DTree().parse(filepath) # json tree
-    import json
-    print(json.dumps(data, indent=1))
-    #dump(data)
-
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# Streaming .b3d writer without Blender. Chunks are written straight to the
+# file: begin() leaves a size placeholder and end() seeks back to patch it,
+# so nothing but the open chunk offsets is kept in memory. Record chunks
+# take NumPy arrays (or anything np.asarray accepts) and are encoded in
+# blocks, the same layout B3DParser reads them with.
+#
+#   with B3DWriter('out.b3d') as w:
+#       w.begin_bb3d()
+#       w.texs([{'name':'skin.png'}])
+#       w.brus([{'name':'skin', 'tids':[0]}])
+#       w.begin_node('root')
+#       w.begin_mesh()
+#       w.vrts(positions, normals=normals, uvs=uvs)
+#       w.tris(0, indices)
+#       w.end() # MESH
+#       w.end() # NODE
+#       w.end() # BB3D
+
+import struct
+
+import numpy as np
+
+try:
+    from .B3DParser import vrts_dtype, keys_dtype, tris_dtype, bone_dtype
+except ImportError:
+    from B3DParser import vrts_dtype, keys_dtype, tris_dtype, bone_dtype
+
+# records encoded per write, bounds the temporary buffer
+BLOCK = 1<<16
+
+class B3DWriter:
+    # target is a path or a seekable binary file
+    def __init__(self, target):
+        self.owned = isinstance(target, str)
+        self.fp = open(target, 'wb') if self.owned else target
+        self.stack = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        elif self.owned:
+            self.fp.close()
+
+    def close(self):
+        if self.stack:
+            raise ValueError('%d chunks left open' % len(self.stack))
+        if self.owned:
+            self.fp.close()
+
+    def begin(self, chunk):
+        self.stack.append(self.fp.tell())
+        self.fp.write(chunk.encode() + b'\x00\x00\x00\x00')
+
+    def end(self):
+        if not self.stack:
+            raise ValueError('end() without an open chunk')
+        start = self.stack.pop()
+        pos = self.fp.tell()
+        self.fp.seek(start+4)
+        self.fp.write(struct.pack('<i', pos-start-8))
+        self.fp.seek(pos)
+
+    def write(self, data):
+        self.fp.write(data)
+
+    def ints(self, *values):
+        self.fp.write(struct.pack('<%di' % len(values), *values))
+
+    def floats(self, *values):
+        self.fp.write(struct.pack('<%df' % len(values), *values))
+
+    def string(self, s):
+        self.fp.write(s.encode() + b'\x00')
+
+    def records(self, dtype, columns, count):
+        # columns maps dtype field names to arrays of count rows
+        for start in range(0, count, BLOCK):
+            block = np.empty(min(BLOCK, count-start), dtype)
+            for name, column in columns.items():
+                block[name] = column[start:start+len(block)]
+            self.fp.write(block.data)
+
+    def begin_bb3d(self, version=1):
+        self.begin('BB3D')
+        self.ints(version)
+
+    # textures and materials are dicts as B3DParser returns them, missing keys get defaults
+    def texs(self, textures):
+        self.begin('TEXS')
+        for t in textures:
+            self.string(t['name'])
+            self.ints(t.get('flags', 1), t.get('blend', 2))
+            self.floats(*t.get('position', (0, 0)), *t.get('scale', (1, 1)), t.get('rotation', 0))
+        self.end()
+
+    def brus(self, materials, n_texs=None):
+        if n_texs is None:
+            n_texs = max([len(m.get('tids', ())) for m in materials] or [0])
+        self.begin('BRUS')
+        self.ints(n_texs)
+        for m in materials:
+            tids = list(m.get('tids', ()))
+            self.string(m['name'])
+            self.floats(*m.get('rgba', (1, 1, 1, 1)), m.get('shine', 0))
+            self.ints(m.get('blend', 1), m.get('fx', 0), *(tids + [-1]*(n_texs-len(tids))))
+        self.end()
+
+    # rotation is a (w, x, y, z) quaternion
+    def begin_node(self, name, position=(0, 0, 0), rotation=(1, 0, 0, 0), scale=(1, 1, 1)):
+        self.begin('NODE')
+        self.string(name)
+        self.floats(*position, *scale, *rotation)
+
+    def begin_mesh(self, brush_id=-1):
+        self.begin('MESH')
+        self.ints(brush_id)
+
+    # uvs is (n, sets, components), or (n, components) for a single set;
+    # None or a column shorter than vertices (B3DParser's empty arrays) is absent
+    def vrts(self, vertices, normals=None, rgba=None, uvs=None):
+        vertices = np.asarray(vertices)
+        columns = {'position':vertices}
+        flags = tcs = tcss = 0
+        if present(normals, vertices):
+            columns['normal'] = np.asarray(normals)
+            flags |= 1
+        if present(rgba, vertices):
+            columns['color'] = np.asarray(rgba)
+            flags |= 2
+        if present(uvs, vertices):
+            uvs = np.asarray(uvs)
+            if uvs.ndim == 2:
+                uvs = uvs[:, None, :]
+            tcs, tcss = uvs.shape[1:]
+            if tcs*tcss:
+                columns['uv'] = uvs
+        self.begin('VRTS')
+        self.ints(flags, tcs, tcss)
+        self.records(vrts_dtype(flags, tcs, tcss), columns, len(vertices))
+        self.end()
+
+    def tris(self, brush_id, indices):
+        indices = np.asarray(indices)
+        self.begin('TRIS')
+        self.ints(brush_id)
+        self.records(tris_dtype, {'indices':indices}, len(indices))
+        self.end()
+
+    def bone(self, vertex_ids, weights):
+        vertex_ids = np.asarray(vertex_ids)
+        self.begin('BONE')
+        self.records(bone_dtype, {'vertex_id':vertex_ids, 'weight':np.asarray(weights)}, len(vertex_ids))
+        self.end()
+
+    def keys(self, frames, positions=None, scales=None, rotations=None):
+        frames = np.asarray(frames)
+        columns = {'frame':frames}
+        flags = 0
+        for bit, name, values in ((1, 'position', positions), (2, 'scale', scales), (4, 'rotation', rotations)):
+            if present(values, frames):
+                columns[name] = np.asarray(values)
+                flags |= bit
+        self.begin('KEYS')
+        self.ints(flags)
+        self.records(keys_dtype(flags), columns, len(frames))
+        self.end()
+
+    def anim(self, frames, fps=60, flags=0):
+        self.begin('ANIM')
+        self.ints(flags, frames)
+        self.floats(fps)
+        self.end()
+
+
+def present(values, rows):
+    return values is not None and len(values) == len(rows)
@@ -114,14 +114,82 @@ class ExportB3D(bpy.types.Operator, ExportHelper):
             description="Export selected objects only",
             default=False
             )
+    use_weld: BoolProperty(
+            name="Weld Vertices",
+            description="Merge face corners with the same position, normal, "
+                        "color, UVs and bone weights into one vertex",
+            default=False
+            )
+    weld_epsilon: FloatProperty(
+            name="Weld Distance",
+            description="Grid size values are quantized to when welding: values "
+                        "in the same grid cell are merged, close values on either "
+                        "side of a cell boundary are not",
+            min=0.0, max=1.0,
+            soft_min=0.0, soft_max=0.01,
+            default=0.00001,
+            precision=6,
+            )
+    use_optimize: BoolProperty(
+            name="Optimize Triangle Order",
+            description="Reorder triangles for the GPU vertex cache and vertices "
+                        "by first use (slower export)",
+            default=False
+            )
+    use_reduce_keys: BoolProperty(
+            name="Reduce Keyframes",
+            description="Drop baked bone keys that interpolation from the kept "
+                        "keys reproduces within the tolerances",
+            default=False
+            )
+    key_position_tolerance: FloatProperty(
+            name="Position Tolerance",
+            description="Largest position error of a dropped key",
+            min=0.0, soft_max=0.1,
+            default=0.001,
+            precision=4,
+            )
+    key_scale_tolerance: FloatProperty(
+            name="Scale Tolerance",
+            description="Largest scale error of a dropped key",
+            min=0.0, soft_max=0.1,
+            default=0.001,
+            precision=4,
+            )
+    key_rotation_tolerance: FloatProperty(
+            name="Rotation Tolerance",
+            description="Largest rotation error of a dropped key",
+            subtype='ANGLE',
+            min=0.0, soft_max=0.1,
+            default=0.001,
+            precision=4,
+            )
+    use_sample_actions: BoolProperty(
+            name="Sample Actions Directly",
+            description="Evaluate armature actions without updating the whole scene "
+                        "on every frame (armatures with constraints, drivers or NLA "
+                        "strips are still sampled through the scene)",
+            default=False
+            )
 
     def execute(self, context):
         from . import export_b3d
 
         export_b3d.b3d_parameters["vertex-normals"] = True
         export_b3d.b3d_parameters["export-selected"] = self.use_selection
-
-        keywords = self.as_keywords(ignore=("filter_glob", "check_existing"))
+        export_b3d.b3d_parameters["weld-vertices"] = self.use_weld
+        export_b3d.b3d_parameters["weld-epsilon"] = self.weld_epsilon
+        export_b3d.b3d_parameters["optimize-tris"] = self.use_optimize
+        export_b3d.b3d_parameters["reduce-keys"] = self.use_reduce_keys
+        export_b3d.b3d_parameters["key-position-tolerance"] = self.key_position_tolerance
+        export_b3d.b3d_parameters["key-scale-tolerance"] = self.key_scale_tolerance
+        export_b3d.b3d_parameters["key-rotation-tolerance"] = self.key_rotation_tolerance
+        export_b3d.b3d_parameters["sample-actions"] = self.use_sample_actions
+
+        keywords = self.as_keywords(ignore=("filter_glob", "check_existing", "use_weld", "weld_epsilon",
+                                            "use_optimize", "use_reduce_keys", "key_position_tolerance",
+                                            "key_scale_tolerance", "key_rotation_tolerance",
+                                            "use_sample_actions"))
 
         return export_b3d.save(self, context, **keywords)
 
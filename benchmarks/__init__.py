@@ -0,0 +1,2 @@
+# Benchmarks for the B3D parser, run from the repository root, e.g.
+#   python -m benchmarks.strings
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# Concurrent parses in an asyncio service
+# usage: python -m benchmarks.concurrency [--files N] [--scale F]
+#
+# Parses N generated files at once, the way a web service answering N
+# requests would, and reports the total wall time and the longest stretch
+# the event loop was blocked (measured by a 1 ms ticker task):
+#   sync        B3DTree().parse called from a coroutine, one after another
+#   executor    B3DTree().parse in the loop's default thread pool
+#   async file  B3DTree().parse_async(path), reads run in the executor
+#   async bytes B3DTree().parse_async(bytes), e.g. a request body
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+
+from B3DParser import B3DTree
+from benchmarks.generate import generate
+
+shapes = [
+    dict(vertices=20000, triangles=40000),
+    dict(vertices=5000, triangles=10000, bones=40, keys=500, depth=4),
+]
+
+async def ticker(stop, lag):
+    # the longest gap between ticks is the worst stall a request would see
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        lag[0] = max(lag[0], now - last - 0.001)
+        last = now
+
+async def measure(job, files):
+    stop = asyncio.Event()
+    lag = [0.0]
+    tick = asyncio.ensure_future(ticker(stop, lag))
+    await asyncio.sleep(0.005)
+    start = time.perf_counter()
+    await job(files)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    return elapsed, lag[0]
+
+async def sync(files):
+    for filepath, data in files:
+        B3DTree().parse(filepath)
+
+async def executor(files):
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(None, B3DTree().parse, filepath) for filepath, data in files))
+
+async def async_file(files):
+    await asyncio.gather(*(B3DTree().parse_async(filepath) for filepath, data in files))
+
+async def async_bytes(files):
+    await asyncio.gather(*(B3DTree().parse_async(data) for filepath, data in files))
+
+jobs = [('sync', sync), ('executor', executor), ('async file', async_file), ('async bytes', async_bytes)]
+
+def run(count=64, scale=1.0):
+    tmp = tempfile.mkdtemp(prefix='b3dbench')
+    try:
+        files = []
+        for i in range(count):
+            shape = dict(shapes[i % len(shapes)], seed=i)
+            for k in ('vertices', 'triangles', 'keys'):
+                if k in shape:
+                    shape[k] = max(1, int(shape[k]*scale))
+            filepath = os.path.join(tmp, '%04d.b3d' % i)
+            generate(filepath, **shape)
+            with open(filepath, 'rb') as fp:
+                files.append((filepath, fp.read()))
+
+        total = sum(len(data) for filepath, data in files)
+        print('%d files, %.1f MB' % (count, total / 1e6), file=sys.stderr)
+        print('%-12s %10s %10s %14s' % ('path', 'total s', 'MB/s', 'worst stall ms'))
+        for name, job in jobs:
+            elapsed, lag = asyncio.run(measure(job, files))
+            print('%-12s %10.3f %10.1f %14.2f' % (name, elapsed, total / elapsed / 1e6, lag * 1000))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.concurrency')
+    parser.add_argument('--files', type=int, default=64)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply vertex, triangle and key counts')
+    args = parser.parse_args()
+    run(args.files, args.scale)
@@ -0,0 +1,495 @@
+#!/usr/bin/python3
+# Equivalence checks for the vectorized exporter passes, run without Blender
+# usage: python -m benchmarks.export_equivalence [--seed N]
+#
+# export_b3d builds VRTS records, skin weights and bone keys with NumPy. This
+# runs those passes on synthetic meshes and rigs through small stand-ins for
+# bpy and mathutils (installed only when the real modules are missing) and
+# compares them with the per-corner and per-bone loops they replaced, which
+# are kept below as reference implementations:
+#   VRTS  every value within 2 float32 ulp, per_face_vertices exactly
+#   BONE  the chunk bytes exactly, zero weights left out
+#   KEYS  positions, scales and rotations within 1e-5, sampled through the
+#         scene and, with sample-actions, from the action's fcurves, on a rig
+#         with connected bones whose location curves must be ignored
+# The exit status is 1 on any mismatch.
+
+import sys
+import math
+import types
+import struct
+
+import numpy as np
+
+# ==== bpy and mathutils stand-ins ====
+
+class Vector:
+    def __init__(self, values):
+        self.v = np.array(values, np.float32)
+
+    def __getitem__(self, i):
+        return float(self.v[i])
+
+    def __len__(self):
+        return len(self.v)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.v.astype(dtype or np.float32)
+
+    x = property(lambda self: float(self.v[0]))
+    y = property(lambda self: float(self.v[1]))
+    z = property(lambda self: float(self.v[2]))
+
+    def normalize(self):
+        length = np.linalg.norm(self.v.astype(np.float64))
+        if length:
+            self.v = (self.v / length).astype(np.float32)
+
+class Quaternion:
+    def __init__(self, values):
+        self.q = np.array(values, np.float32)
+
+    w = property(lambda self: float(self.q[0]), lambda self, a: self.q.__setitem__(0, a))
+    x = property(lambda self: float(self.q[1]), lambda self, a: self.q.__setitem__(1, a))
+    y = property(lambda self: float(self.q[2]), lambda self, a: self.q.__setitem__(2, a))
+    z = property(lambda self: float(self.q[3]), lambda self, a: self.q.__setitem__(3, a))
+
+    def normalize(self):
+        self.q = (self.q / np.linalg.norm(self.q.astype(np.float64))).astype(np.float32)
+
+class Row:
+    def __init__(self, m, r):
+        self.m, self.r = m, r
+
+    def __getitem__(self, c):
+        return float(self.m[self.r, c])
+
+    def __setitem__(self, c, value):
+        self.m[self.r, c] = value
+
+class Matrix:
+    # row-major float32 storage, products computed in float64
+    def __init__(self, values=None):
+        m = np.eye(4) if values is None else np.asarray(values.m if isinstance(values, Matrix) else values, np.float64)
+        self.m = m.astype(np.float32)
+
+    @staticmethod
+    def Translation(v):
+        m = np.eye(4)
+        m[:3, 3] = np.asarray(v, np.float64)[:3]
+        return Matrix(m)
+
+    def __getitem__(self, r):
+        return Row(self.m, r)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.m.astype(dtype or np.float32)
+
+    def __matmul__(self, other):
+        if isinstance(other, Vector):
+            return Vector((self.m.astype(np.float64) @ np.append(other.v, 1))[:3])
+        return Matrix(self.m.astype(np.float64) @ other.m)
+
+    def __mul__(self, other):
+        # element-wise, like mathutils since 2.80
+        return Matrix(self.m * other.m)
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self.m.astype(np.float64)))
+
+    def to_4x4(self):
+        m = np.eye(4)
+        m[:len(self.m), :len(self.m)] = self.m
+        return Matrix(m)
+
+    def copy(self):
+        return Matrix(self)
+
+    def to_translation(self):
+        return Vector(self.m[:3, 3])
+
+    def to_scale(self):
+        return Vector(np.linalg.norm(self.m[:3, :3].astype(np.float64), axis=0))
+
+    def to_quaternion(self):
+        # mathutils' mat3_normalized_to_quat on the column-normalized 3x3
+        m = self.m[:3, :3].astype(np.float64)
+        m = m / np.linalg.norm(m, axis=0)
+        trace = 0.25 * (1 + m[0, 0] + m[1, 1] + m[2, 2])
+        if trace > 1e-4:
+            s = math.sqrt(trace)
+            w = s
+            s = 1 / (4 * s)
+            q = (w, (m[2, 1] - m[1, 2]) * s, (m[0, 2] - m[2, 0]) * s, (m[1, 0] - m[0, 1]) * s)
+        elif m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+            s = 2 * math.sqrt(1 + m[0, 0] - m[1, 1] - m[2, 2])
+            q = ((m[2, 1] - m[1, 2]) / s, s / 4, (m[0, 1] + m[1, 0]) / s, (m[0, 2] + m[2, 0]) / s)
+        elif m[1, 1] > m[2, 2]:
+            s = 2 * math.sqrt(1 + m[1, 1] - m[0, 0] - m[2, 2])
+            q = ((m[0, 2] - m[2, 0]) / s, (m[0, 1] + m[1, 0]) / s, s / 4, (m[1, 2] + m[2, 1]) / s)
+        else:
+            s = 2 * math.sqrt(1 + m[2, 2] - m[0, 0] - m[1, 1])
+            q = ((m[1, 0] - m[0, 1]) / s, (m[0, 2] + m[2, 0]) / s, (m[1, 2] + m[2, 1]) / s, s / 4)
+        q = Quaternion(q)
+        q.normalize()
+        return q
+
+def install_stand_ins():
+    try:
+        import bpy, mathutils
+        return mathutils
+    except ImportError:
+        pass
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Vector, mathutils.Quaternion, mathutils.Matrix = Vector, Quaternion, Matrix
+    bpy = types.ModuleType('bpy')
+    bpy.app = types.SimpleNamespace(version=(2, 93, 0))
+    sys.modules['mathutils'] = mathutils
+    sys.modules['bpy'] = bpy
+    return mathutils
+
+mathutils = install_stand_ins()
+
+import export_b3d
+
+class Collection(list):
+    # bpy_prop_collection: foreach_get flattens one attribute of every item
+    def foreach_get(self, attr, buf):
+        buf[:] = np.ravel([np.asarray(getattr(item, attr)) for item in self])
+
+class VertexGroup:
+    def __init__(self, name, weights):
+        self.name, self.weights = name, weights
+
+    def weight(self, vertex):
+        if vertex not in self.weights:
+            raise RuntimeError('vertex not in group')
+        return self.weights[vertex]
+
+TRANS_MATRIX = [[1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]]
+
+# ==== Meshes: VRTS and BONE ====
+
+def make_mesh(rng, faces=500, uv_layers=1, groups=6, smooth=False):
+    count = faces
+    vertices = Collection(types.SimpleNamespace(index=i, co=Vector(rng.normal(size=3)), groups=[]) for i in range(count))
+    normals, uvs = rng.normal(size=(count, 3)), rng.random((uv_layers, count, 2))
+    polygons, loops = Collection(), Collection()
+    for index, size in enumerate(rng.integers(3, 6, faces).tolist()):
+        corners = rng.choice(count, size, replace=False).tolist()
+        start = len(loops)
+        polygons.append(types.SimpleNamespace(index=index, loop_start=start, loop_total=size,
+                                              loop_indices=list(range(start, start+size)), vertices=corners))
+        for v in corners:
+            loops.append(types.SimpleNamespace(index=len(loops), vertex_index=v,
+                                               normal=Vector(normals[v] if smooth else rng.normal(size=3))))
+    layers = [types.SimpleNamespace(data=Collection(types.SimpleNamespace(uv=np.float32(uvs[k, l.vertex_index] if smooth else rng.random(2)))
+                                                    for l in loops)) for k in range(uv_layers)]
+    vertex_groups = []
+    for g in range(groups):
+        members = rng.choice(count, count // 3, replace=False).tolist()
+        weights = {v: float(rng.random()) for v in members}
+        weights[members[0]] = 0.0 # members with a zero weight are left out of BONE
+        vertex_groups.append(VertexGroup('bone%d' % g, weights))
+        for v, w in weights.items():
+            vertices[v].groups.append(types.SimpleNamespace(group=g, weight=w))
+    data = types.SimpleNamespace(polygons=polygons, loops=loops, vertices=vertices, uv_layers=layers,
+                                 vertex_colors=[], calc_normals_split=lambda: None)
+    world = Matrix([[0,-1,0,1],[1,0,0,2],[0,0,1,3],[0,0,0,1]])
+    obj = types.SimpleNamespace(name='mesh', vertex_groups=vertex_groups, matrix_world=world)
+    return obj, data
+
+def reference_vrts(obj, data, arm_action):
+    # the per-corner loop write_node_mesh_vrts used, writing every UV layer's own value
+    records, per_face, weights = [], {}, []
+    mesh_matrix = obj.matrix_world.copy()
+    ivert = -1
+    for face in data.polygons:
+        per_face[face.index] = []
+        for vertex_id, loop_index in enumerate(face.loop_indices):
+            loop = data.loops[loop_index]
+            vert = loop.vertex_index
+            ivert += 1
+            per_face[face.index].append(ivert)
+
+            if arm_action:
+                vert_matrix = mathutils.Matrix.Translation(mesh_matrix @ data.vertices[vert].co)
+            else:
+                vert_matrix = mathutils.Matrix.Translation(data.vertices[vert].co)
+            vcoord = (vert_matrix @ mathutils.Matrix(TRANS_MATRIX)).to_translation()
+            records.append(struct.pack('<fff', vcoord.x, vcoord.z, vcoord.y))
+
+            normal_vector = (mathutils.Matrix.Translation(loop.normal) @ mathutils.Matrix(TRANS_MATRIX)).to_translation()
+            normal_vector.normalize()
+            records.append(struct.pack('<fff', normal_vector.x, normal_vector.z, normal_vector.y))
+
+            groups = {}
+            for vg in obj.vertex_groups:
+                w = 0.0
+                try:
+                    w = vg.weight(vert)
+                except:
+                    pass
+                groups[vg.name] = w
+            weights.append(groups)
+
+            for layer in data.uv_layers:
+                uv = layer.data[loop.index].uv
+                records.append(struct.pack('<ff', uv[0], 1-uv[1]))
+    return struct.pack('<3i', 1, len(data.uv_layers), 2) + b''.join(records), per_face, weights
+
+def reference_bone(weights, name):
+    # the per-bone scan of write_node_bone, without the zero weights
+    records = b''.join(struct.pack('<if', ivert, groups[name]) for ivert, groups in enumerate(weights) if groups.get(name))
+    return b'BONE' + struct.pack('<i', len(records)) + records
+
+def close_floats(a, b, ulps=2):
+    a, b = np.frombuffer(a, '<f4'), np.frombuffer(b, '<f4')
+    return len(a) == len(b) and bool((np.abs(a - b) <= ulps * np.spacing(np.maximum(np.abs(a), np.abs(b)))).all())
+
+def check_mesh(rng, failures, arm_action, uv_layers, weld):
+    name = 'mesh arm=%d uv_layers=%d weld=%d' % (arm_action, uv_layers, weld)
+    obj, data = make_mesh(rng, uv_layers=uv_layers, smooth=weld)
+    expected, per_face, weights = reference_vrts(obj, data, arm_action)
+
+    export_b3d.the_scene = types.SimpleNamespace(frame_current=1, frame_subframe=0.0, frame_set=lambda frame, subframe=0.0: None)
+    export_b3d.b3d_parameters = {'vertex-normals': True, 'weld-vertices': weld}
+    export_b3d.per_face_vertices = {}
+    chunk = bytes(export_b3d.write_node_mesh_vrts(obj, data, 0, arm_action, 0))
+    vrts = chunk[8:]
+
+    if not weld:
+        if vrts[:12] != expected[:12] or not close_floats(vrts[12:], expected[12:]):
+            failures.append('%s: VRTS records differ' % name)
+        if export_b3d.per_face_vertices != per_face:
+            failures.append('%s: per_face_vertices differ' % name)
+        for vg in obj.vertex_groups:
+            export_b3d.bone_stack = {vg.name: [None, None, vg]}
+            if bytes(export_b3d.write_node_bone(vg.name)) != reference_bone(weights, vg.name):
+                failures.append('%s: BONE %s differs' % (name, vg.name))
+        return
+
+    # welded: every corner's new vertex carries the corner's values and weights
+    stride = (len(expected) - 12) // 4 // len(weights)
+    old = np.frombuffer(expected[12:], '<f4').reshape(len(weights), stride)
+    new = np.frombuffer(vrts[12:], '<f4').reshape(-1, stride)
+    remap = np.empty(len(weights), np.int64)
+    for face in data.polygons:
+        remap[per_face[face.index]] = export_b3d.per_face_vertices[face.index]
+    if len(new) >= len(old):
+        failures.append('%s: nothing was welded' % name)
+    if not close_floats(new[remap].tobytes(), old.tobytes()):
+        failures.append('%s: welded VRTS records differ' % name)
+    welded = [{} for i in range(len(new))]
+    for group, (corners, values) in export_b3d.bone_weights.items():
+        for ivert, w in zip(corners.tolist(), values.tolist()):
+            welded[ivert][group] = w
+    if any(welded[remap[c]] != {g: float(np.float32(w)) for g, w in groups.items() if w} for c, groups in enumerate(weights)):
+        failures.append('%s: welded weights differ' % name)
+
+# ==== Rigs: KEYS ====
+
+def basis_matrix(loc, rot, scale, mode):
+    # pose bone matrix_basis for quaternion and XYZ euler rotations
+    if mode == 'QUATERNION':
+        w, x, y, z = np.asarray(rot) / np.linalg.norm(rot)
+        r = np.array([[1-2*(y*y+z*z), 2*(x*y-w*z), 2*(x*z+w*y)],
+                      [2*(x*y+w*z), 1-2*(x*x+z*z), 2*(y*z-w*x)],
+                      [2*(x*z-w*y), 2*(y*z+w*x), 1-2*(x*x+y*y)]])
+    else:
+        (cx, cy, cz), (sx, sy, sz) = np.cos(rot), np.sin(rot)
+        rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+        ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+        rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+        r = rz @ ry @ rx
+    m = np.eye(4)
+    m[:3, :3] = r * np.asarray(scale)
+    m[:3, 3] = loc
+    return m
+
+class Curve:
+    def __init__(self, data_path, index, func, frames):
+        self.data_path, self.array_index, self.func, self.mute = data_path, index, func, False
+        self.keyframe_points = [types.SimpleNamespace(co=(frames, 0.0))]
+
+    def evaluate(self, frame):
+        return self.func(frame)
+
+class PoseBones(Collection):
+    def __getitem__(self, key):
+        return self.by_name[key] if isinstance(key, str) else list.__getitem__(self, key)
+
+    def foreach_get(self, attr, buf):
+        # matrices come column-major, like Blender's
+        buf[:] = np.ravel([np.asarray(getattr(item, attr)).T for item in list.__iter__(self)])
+
+def make_rig(rng, bones=24, frames=40):
+    data_bones = {}
+    for i in range(bones):
+        parent = data_bones['b%d' % rng.integers(i)] if i % 7 else None
+        rest = basis_matrix(rng.normal(size=3), rng.normal(size=4), (1, 1, 1), 'QUATERNION')
+        bone = types.SimpleNamespace(name='b%d' % i, parent=parent, children=[], matrix_local=Matrix(rest),
+                                     matrix=Matrix(rest[:3, :3]), use_inherit_rotation=True,
+                                     use_local_location=True, inherit_scale='FULL', use_connect=bool(parent) and i % 3 == 0)
+        if parent:
+            parent.children.append(bone)
+        data_bones[bone.name] = bone
+
+    pose_bones = PoseBones()
+    pose_bones.by_name = {}
+    curves = []
+    for bone in data_bones.values():
+        mode = ('QUATERNION', 'XYZ')[len(pose_bones) % 2]
+        pose_bone = types.SimpleNamespace(name=bone.name, bone=bone, constraints=[], rotation_mode=mode,
+                                          location=tuple(rng.normal(size=3) * 0.1), scale=(1.0, 1.0, 1.0),
+                                          rotation_quaternion=(1.0, 0.0, 0.0, 0.0), rotation_euler=(0.0, 0.0, 0.0),
+                                          path_from_id=lambda prop, name=bone.name: 'pose.bones["%s"].%s' % (name, prop))
+        pose_bones.append(pose_bone)
+        pose_bones.by_name[bone.name] = pose_bone
+        prop, size = ('rotation_quaternion', 4) if mode == 'QUATERNION' else ('rotation_euler', 3)
+        # connected bones get location curves too, which Blender ignores
+        for prop, size, base, amount in ((prop, size, 0.0, 1.0), ('location', 3, 0.0, 0.1), ('scale', 3, 1.0, 0.1)):
+            for index in range(size):
+                a, speed, phase = rng.normal(), rng.uniform(0.02, 0.2), rng.normal()
+                offset = 1.0 if prop == 'rotation_quaternion' and index == 0 else base
+                curves.append(Curve(pose_bone.path_from_id(prop), index,
+                                    lambda t, a=a, speed=speed, phase=phase, offset=offset, amount=amount: offset + amount * a * math.sin(speed * t + phase),
+                                    frames))
+    for pose_bone in pose_bones:
+        pose_bone.parent = pose_bones.by_name[pose_bone.bone.parent.name] if pose_bone.bone.parent else None
+        chain, parent = [], pose_bone.parent
+        while parent:
+            chain.append(parent)
+            parent = parent.parent
+        pose_bone.parent_recursive = chain
+
+    anim_data = types.SimpleNamespace(action=types.SimpleNamespace(fcurves=curves), drivers=[], nla_tracks=[],
+                                      action_blend_type='REPLACE', action_influence=1.0)
+    arm = types.SimpleNamespace(name='rig', type='ARMATURE', data=types.SimpleNamespace(bones=data_bones),
+                                pose=types.SimpleNamespace(bones=pose_bones), animation_data=anim_data,
+                                matrix_world=Matrix(basis_matrix((1, 2, 3), (0.9, 0.1, 0.2, 0.3), (1, 1, 1), 'QUATERNION')),
+                                constraints=[], parent=None)
+
+    curve_of = {(c.data_path, c.array_index): c for c in curves}
+    def frame_set(frame, subframe=0.0):
+        # the depsgraph's part: every pose bone from its channels and its parent's pose
+        scene.frame_current = frame
+        poses = {}
+        for pose_bone in sorted(pose_bones, key=lambda p: len(p.parent_recursive)):
+            def channel(prop, size):
+                return [curve_of[(pose_bone.path_from_id(prop), i)].evaluate(frame) if (pose_bone.path_from_id(prop), i) in curve_of
+                        else getattr(pose_bone, prop)[i] for i in range(size)]
+            mode = pose_bone.rotation_mode
+            rot = channel('rotation_quaternion', 4) if mode == 'QUATERNION' else channel('rotation_euler', 3)
+            # BKE_pchan_to_mat4 only applies the location of unconnected bones
+            location = (0, 0, 0) if pose_bone.bone.use_connect else channel('location', 3)
+            pose = np.asarray(pose_bone.bone.matrix_local, np.float64) @ basis_matrix(location, rot, channel('scale', 3), mode)
+            if pose_bone.parent:
+                parent_rest = np.asarray(pose_bone.parent.bone.matrix_local, np.float64)
+                pose = poses[pose_bone.parent.name] @ np.linalg.inv(parent_rest) @ pose
+            poses[pose_bone.name] = pose
+            pose_bone.matrix = Matrix(pose)
+    scene = types.SimpleNamespace(frame_start=1, frame_current=0, frame_subframe=0.0, frame_set=frame_set)
+    mesh = types.SimpleNamespace(type='MESH', name='skin', modifiers=[types.SimpleNamespace(type='ARMATURE', object=arm)], parent=None)
+    return scene, arm, mesh, frames
+
+def reference_keys(scene, arm, frames, local_space):
+    # the per-bone loop of write_node's frame sampling, with mathutils matrices
+    keys = {name: [] for name in arm.data.bones}
+    transform = mathutils.Matrix([[-1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]])
+    for frame in range(1, frames+1):
+        scene.frame_set(frame, subframe=0.0)
+        arm_matrix = transform @ arm.matrix_world
+        for name, bone in arm.data.bones.items():
+            bone_matrix = mathutils.Matrix(arm.pose.bones[name].matrix)
+            if bone.parent:
+                bone_matrix = mathutils.Matrix(arm.pose.bones[bone.parent.name].matrix).inverted() @ bone_matrix
+            elif local_space:
+                bone_matrix = bone_matrix * transform
+            else:
+                bone_matrix = arm_matrix @ bone_matrix
+            bone_sca = bone_matrix.to_scale()
+            bone_loc = bone_matrix.to_translation().v.copy()
+            bone_rot = bone_matrix.to_quaternion()
+            bone_rot.normalize()
+            rot = bone_rot.q.copy()
+            if local_space:
+                if not bone.parent:
+                    rot = np.array((rot[0], -rot[1], rot[3], rot[2]))
+                else:
+                    bone_loc = bone_loc[[0, 2, 1]]
+            keys[name].append((frame, bone_loc, bone_sca.v.copy(), rot))
+    return keys
+
+def reference_keys_chunk(keys, has_parent, local_space):
+    # the per-key packing of write_node_keys
+    records = []
+    for frame, p, s, q in keys:
+        if local_space:
+            p = (-p[0], p[2], p[1]) if has_parent else (p[0], p[2], p[1])
+        else:
+            p = (-p[0], p[1], p[2])
+        records.append(struct.pack('<i3f3f4f', frame, *p, *s, q[0], -q[1], q[2], q[3]))
+    return struct.pack('<i', 7) + b''.join(records)
+
+def check_rig(rng, failures, local_space, sample_actions):
+    name = 'rig local_space=%d sample_actions=%d' % (local_space, sample_actions)
+    scene, arm, mesh, frames = make_rig(rng)
+    expected = reference_keys(scene, arm, frames, local_space)
+
+    export_b3d.the_scene = scene
+    export_b3d.b3d_parameters = {'local-space': local_space, 'sample-actions': sample_actions}
+    export_b3d.pose_cache = {}
+    write_node_mesh = export_b3d.write_node_mesh
+    export_b3d.write_node_mesh = lambda *args: b''
+    try:
+        export_b3d.write_node([mesh])
+    finally:
+        export_b3d.write_node_mesh = write_node_mesh
+
+    for bone_name, keys in expected.items():
+        frames_, locs, scas, rots = export_b3d.keys_stack[bone_name]
+        want = [np.array([k[i] for k in keys], np.float64) for i in range(4)]
+        rots = rots * np.sign((rots * want[3]).sum(axis=1))[:, None]
+        if (frames_ != want[0]).any() or not all(np.allclose(a, b, atol=1e-5) for a, b in zip((locs, scas, rots), want[1:])):
+            failures.append('%s: keys of %s differ' % (name, bone_name))
+            continue
+        has_parent = arm.data.bones[bone_name].parent is not None
+        chunk = bytes(export_b3d.write_node_keys(bone_name))[8:]
+        reference = reference_keys_chunk(keys, has_parent, local_space)
+        if len(chunk) != len(reference):
+            failures.append('%s: KEYS %s length differs' % (name, bone_name))
+            continue
+        a = np.frombuffer(chunk[4:], [('frame', '<i4'), ('values', '<f4', 10)])
+        b = np.frombuffer(reference[4:], a.dtype)
+        values = a['values'].copy()
+        values[:, 6:] *= np.sign((values[:, 6:] * b['values'][:, 6:]).sum(axis=1))[:, None]
+        if (a['frame'] != b['frame']).any() or not np.allclose(values, b['values'], atol=1e-5):
+            failures.append('%s: KEYS %s differs' % (name, bone_name))
+
+def run(seed=0):
+    rng = np.random.default_rng(seed)
+    export_b3d.PROGRESS = False
+    failures = []
+    checks = 0
+    for arm_action in (False, True):
+        for uv_layers in (0, 1, 2):
+            check_mesh(rng, failures, arm_action, uv_layers, False)
+            checks += 1
+    check_mesh(rng, failures, True, 1, True)
+    checks += 1
+    for local_space in (False, True):
+        for sample_actions in (False, True):
+            check_rig(rng, failures, local_space, sample_actions)
+            checks += 1
+    for failure in failures:
+        print('FAIL', failure)
+    print('%d checks, %d failures' % (checks, len(failures)))
+    return not failures
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.export_equivalence')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.seed) else 1)
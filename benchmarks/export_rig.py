@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# Exporter benchmark on a synthetic skinned rig, runs inside Blender
+# usage: blender -b --factory-startup -P benchmarks/export_rig.py -- [--bones N] [--frames N] [--vertices N] [--sample-actions] [--baseline] [--out rig.b3d]
+#
+# Builds a chain of N bones keyed on every frame and a grid mesh skinned to
+# them (two weights per vertex), then exports it with export_b3d and prints
+# the wall time of the whole export and the time spent writing the MESH chunk
+# and the BONE and KEYS chunks of every bone; the rest is mostly sampling
+# the pose of every frame, which the exporter reports in frames/s. With
+# --sample-actions the action is evaluated without updating the scene.
+# --baseline exports a second time with BONE and KEYS written the way they
+# were before keys and weights were indexed by bone (every bone scanning all
+# keys and all vertex weights), prints both timings and checks that the two
+# files are identical.
+
+import os
+import sys
+import math
+import time
+import random
+import tempfile
+
+import bpy
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export_b3d
+
+def build_rig(bones=100, frames=2000, vertices=20000, seed=0):
+    random.seed(seed)
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    scene = bpy.context.scene
+    scene.frame_start, scene.frame_end = 1, frames
+
+    arm_data = bpy.data.armatures.new('rig')
+    arm = bpy.data.objects.new('rig', arm_data)
+    scene.collection.objects.link(arm)
+    bpy.context.view_layer.objects.active = arm
+    bpy.ops.object.mode_set(mode='EDIT')
+    parent = None
+    for i in range(bones):
+        bone = arm_data.edit_bones.new('bone%03d' % i)
+        bone.head, bone.tail = (0, 0, i), (0, 0, i+1)
+        bone.parent = parent
+        parent = bone
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    side = max(2, int(math.sqrt(vertices)))
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=side-1, y_subdivisions=side-1, size=2)
+    mesh = bpy.context.object
+    mesh.parent = arm
+    mesh.modifiers.new('armature', 'ARMATURE').object = arm
+    groups = [mesh.vertex_groups.new(name=b.name) for b in arm_data.bones]
+    for v in mesh.data.vertices:
+        i = random.randrange(bones)
+        groups[i].add([v.index], 0.75, 'REPLACE')
+        groups[(i+1) % bones].add([v.index], 0.25, 'REPLACE')
+
+    arm.animation_data_create()
+    arm.animation_data.action = bpy.data.actions.new('take')
+    for pose_bone in arm.pose.bones:
+        pose_bone.rotation_mode = 'QUATERNION'
+        for index in range(4):
+            curve = arm.animation_data.action.fcurves.new('pose.bones["%s"].rotation_quaternion' % pose_bone.name, index=index)
+            curve.keyframe_points.add(frames)
+            phase = random.random() * 2 * math.pi
+            values = [(math.cos((f / 50 + phase) / 2) if index == 0 else math.sin((f / 50 + phase) / 2) / math.sqrt(3)) for f in range(frames)]
+            curve.keyframe_points.foreach_set('co', [c for f, value in enumerate(values, 1) for c in (f, value)])
+            curve.update()
+    return scene, mesh
+
+class Timer:
+    # wraps a module function and sums the time spent in it
+    def __init__(self, name):
+        self.name, self.total, self.calls = name, 0.0, 0
+        self.func = getattr(export_b3d, name)
+        setattr(export_b3d, name, self)
+
+    def __call__(self, *args, **kw):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kw)
+        finally:
+            self.total += time.perf_counter() - start
+            self.calls += 1
+
+    def restore(self):
+        setattr(export_b3d, self.name, self.func)
+
+class Legacy:
+    # the previous per-bone writers: one flat list of every key of the armature and
+    # one dict of weights per vertex, scanned in full for every bone; the bone's own
+    # entries are then encoded by the current writers so the output is comparable
+    def __init__(self):
+        self.keys, self.weights = [], []
+        self.funcs = {name: getattr(export_b3d, name) for name in ('write_node_mesh', 'write_node_bone', 'write_node_keys')}
+        for name in self.funcs:
+            setattr(export_b3d, name, getattr(self, name))
+
+    def restore(self):
+        for name, func in self.funcs.items():
+            setattr(export_b3d, name, func)
+
+    def write_node_mesh(self, *args):
+        buf = self.funcs['write_node_mesh'](*args)
+        self.keys = [[frame, name, loc, sca, rot]
+                     for name, (frames, locs, scas, rots) in export_b3d.keys_stack.items()
+                     for frame, loc, sca, rot in zip(frames, locs, scas, rots)]
+        self.weights = [{} for i in range(export_b3d.vertex_count)]
+        for name, (corners, weights) in export_b3d.bone_weights.items():
+            for ivert, weight in zip(corners.tolist(), weights.tolist()):
+                self.weights[ivert][name] = weight
+        return buf
+
+    def write_node_bone(self, ibone):
+        my_name = export_b3d.bone_stack[ibone][export_b3d.BONE_ITSELF].name
+        mine = [(ivert, groups[my_name]) for ivert, groups in enumerate(self.weights) if my_name in groups]
+        saved = export_b3d.bone_weights
+        export_b3d.bone_weights = {my_name: (np.array([i for i, w in mine], np.int64), np.array([w for i, w in mine], np.float32))}
+        try:
+            return self.funcs['write_node_bone'](ibone)
+        finally:
+            export_b3d.bone_weights = saved
+
+    def write_node_keys(self, ibone):
+        my_name = export_b3d.bone_stack[ibone][export_b3d.BONE_ITSELF].name
+        mine = [key for key in self.keys if key[1] == my_name]
+        saved = export_b3d.keys_stack
+        export_b3d.keys_stack = {my_name: tuple(np.array([key[i] for key in mine]).reshape((len(mine),) + shape)
+                                                for i, shape in ((0, ()), (2, (3,)), (3, (3,)), (4, (4,))))}
+        try:
+            return self.funcs['write_node_keys'](ibone)
+        finally:
+            export_b3d.keys_stack = saved
+
+def export(scene, out, sample_actions=False, baseline=False):
+    legacy = Legacy() if baseline else None
+    timers = [Timer(name) for name in ('write_node_bone', 'write_node_keys', 'write_node_mesh')]
+    try:
+        export_b3d.b3d_parameters.clear()
+        export_b3d.b3d_parameters["sample-actions"] = sample_actions
+        export_b3d.the_scene = scene
+        start = time.perf_counter()
+        export_b3d.write_b3d_file(out, list(scene.objects))
+        elapsed = time.perf_counter() - start
+    finally:
+        for t in reversed(timers):
+            t.restore()
+        if legacy:
+            legacy.restore()
+    return elapsed, timers
+
+def run(bones=100, frames=2000, vertices=20000, out=None, sample_actions=False, baseline=False):
+    scene, mesh = build_rig(bones, frames, vertices)
+    out = out or os.path.join(tempfile.mkdtemp(prefix='b3dbench'), 'rig.b3d')
+    runs = [('current', out)] + ([('baseline', out + '.baseline')] if baseline else [])
+    results = [(name, path) + export(scene, path, sample_actions, name == 'baseline') for name, path in runs]
+
+    print('%d bones, %d frames, %d vertices, %.1f MB' % (bones, frames, len(mesh.data.vertices), os.path.getsize(out) / 1e6))
+    print('%-16s' % 'stage' + ''.join('%12s s' % name for name, path, elapsed, timers in results) + '%8s' % 'calls')
+    print('%-16s' % 'export' + ''.join('%14.3f' % elapsed for name, path, elapsed, timers in results) + '%8d' % 1)
+    for i, t in enumerate(results[0][3]):
+        print('%-16s' % t.name + ''.join('%14.3f' % timers[i].total for name, path, elapsed, timers in results) + '%8d' % t.calls)
+    if baseline:
+        with open(out, 'rb') as a, open(out + '.baseline', 'rb') as b:
+            print('output identical:', a.read() == b.read())
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(prog='blender -b -P benchmarks/export_rig.py --')
+    parser.add_argument('--bones', type=int, default=100)
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--vertices', type=int, default=20000)
+    parser.add_argument('--sample-actions', action='store_true', help='evaluate the action without frame_set')
+    parser.add_argument('--baseline', action='store_true', help='also time the previous scanning BONE/KEYS writers')
+    parser.add_argument('--out')
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+    args = parser.parse_args(argv)
+    run(args.bones, args.frames, args.vertices, args.out, args.sample_actions, args.baseline)
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+# Synthetic .b3d generator for the parser benchmarks
+# usage: python -m benchmarks.generate out.b3d [--vertices N] [--triangles N] ...
+#
+# The file has one TEXS and BRUS, a root NODE with a MESH (one TRIS chunk per
+# brush) and, when bones are requested, an ANIM plus bone NODE chains of the
+# given depth. Every bone weighs its share of the vertices and carries one
+# KEYS chunk with position, scale and rotation for every frame.
+
+import numpy as np
+
+from B3DWriter import B3DWriter
+
+def generate(filepath, vertices=10000, uv_sets=1, colors=False, triangles=20000,
+             brushes=1, bones=0, keys=0, depth=1, seed=0):
+    rnd = np.random.RandomState(seed)
+
+    with open(filepath, 'wb') as fp, B3DWriter(fp) as w:
+        w.begin_bb3d()
+        w.texs([{'name':'textures/tex%04d.png' % i} for i in range(brushes)])
+        w.brus([{'name':'brush%04d' % i, 'tids':[i]} for i in range(brushes)])
+        w.begin_node('root')
+
+        # VRTS: position, normal, optional color, uv sets
+        positions = rnd.uniform(-100, 100, (vertices, 3))
+        normals = np.tile((0.0, 1.0, 0.0), (vertices, 1))
+        rgba = rnd.uniform(0, 1, (vertices, 4)) if colors else None
+        uvs = rnd.uniform(0, 1, (vertices, uv_sets, 2))
+        indices = rnd.randint(0, max(vertices, 1), (triangles, 3))
+
+        w.begin_mesh()
+        w.vrts(positions, normals, rgba, uvs)
+        for i, part in enumerate(np.array_split(indices, brushes)):
+            w.tris(i, part)
+        w.end()
+
+        # bone chains of the requested depth, each bone weighs every n-th vertex;
+        # keys are drawn deepest bone first
+        if bones:
+            w.anim(keys)
+            depth = max(depth, 1)
+            for first in range(0, bones, depth):
+                chain = range(first, min(first+depth, bones))
+                values = {b: rnd.uniform(-1, 1, (keys, 10)) for b in reversed(chain)}
+                for b in chain:
+                    w.begin_node('bone%04d' % b)
+                    vertex_ids = np.arange(b, vertices, bones)
+                    w.bone(vertex_ids, np.ones(len(vertex_ids)))
+                    w.keys(np.arange(1, keys+1), values[b][:, :3], values[b][:, 3:6], values[b][:, 6:])
+                for b in chain:
+                    w.end()
+
+        w.end()
+        w.end()
+        return fp.tell()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.generate')
+    parser.add_argument('filepath')
+    parser.add_argument('--vertices', type=int, default=10000)
+    parser.add_argument('--uv-sets', type=int, default=1)
+    parser.add_argument('--colors', action='store_true')
+    parser.add_argument('--triangles', type=int, default=20000)
+    parser.add_argument('--brushes', type=int, default=1)
+    parser.add_argument('--bones', type=int, default=0)
+    parser.add_argument('--keys', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = vars(parser.parse_args())
+    print(generate(args.pop('filepath'), **args), 'bytes')
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# Peak resident memory of B3DTree (dotdict) against B3DModel (__slots__) results
+# usage: python -m benchmarks.memory file.b3d [copies]
+#
+# Each run happens in a fresh process that parses the file `copies` times and
+# keeps every result alive, the way an asset server holds many models at once.
+
+import sys
+import multiprocessing
+
+def peak_rss():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss * 1024 if sys.platform != 'darwin' else rss
+
+def measure(kind, filepath, copies, tuples):
+    from B3DParser import B3DTree
+    from B3DModel import B3DModel
+    parser = B3DTree if kind=='dotdict' else B3DModel
+    before = peak_rss()
+    held = [parser(tuples=tuples).parse(filepath) for _ in range(copies)]
+    return peak_rss() - before
+
+def run(filepath, copies=1):
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for tuples in (False, True):
+        for kind in ('dotdict', 'slots'):
+            with ctx.Pool(1) as pool:
+                results.append((kind, 'tuples' if tuples else 'arrays',
+                                pool.apply(measure, (kind, filepath, copies, tuples))))
+    return results
+
+if __name__ == '__main__':
+    if len(sys.argv)<2:
+        print('Usage: python -m benchmarks.memory [filename.b3d] [copies]')
+        sys.exit(0)
+    filepath = sys.argv[1]
+    copies = int(sys.argv[2]) if len(sys.argv)>2 else 1
+    print('%s, %d copies held' % (filepath, copies))
+    for kind, mode, rss in run(filepath, copies):
+        print('%-8s %-7s %10.1f MB peak RSS growth' % (kind, mode, rss / float(1<<20)))
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# Parser benchmark harness
+# usage: python -m benchmarks.run [--scale F] [--repeat N] [--out results.json] [--compare old.json]
+#
+# Generates the cases below into a temporary directory and times B3DParser
+# (the raw event stream), B3DList, B3DTree and B3DModel on each, in array and
+# tuples mode, with the buffered and the memory-mapped reader. Reports MB/s,
+# vertices/s and the peak traced allocation of one extra run. Results are
+# written as JSON so runs can be compared across commits.
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+import numpy as np
+
+from B3DParser import B3DParser, B3DList, B3DTree
+from B3DModel import B3DModel
+from benchmarks.generate import generate
+
+cases = {
+    'mesh':    dict(vertices=200000, triangles=400000),
+    'level':   dict(vertices=300000, triangles=500000, uv_sets=2, colors=True, brushes=200),
+    'skinned': dict(vertices=50000, triangles=100000, bones=80, keys=3000, depth=8),
+    'deep':    dict(vertices=1000, triangles=2000, bones=400, keys=100, depth=200),
+}
+
+class EventParser(B3DParser):
+    def parse(self, filepath):
+        for event in self.iter_events(filepath):
+            pass
+
+parsers = [('B3DParser', EventParser), ('B3DList', B3DList), ('B3DTree', B3DTree), ('B3DModel', B3DModel)]
+
+def best_time(parser, options, filepath, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser(**options).parse(filepath)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_memory(parser, options, filepath):
+    tracemalloc.start()
+    result = parser(**options).parse(filepath)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(scale=1.0, repeat=3, names=None, tuples=True):
+    tmp = tempfile.mkdtemp(prefix='b3dbench')
+    results = []
+    try:
+        for name, shape in cases.items():
+            if names and name not in names:
+                continue
+            shape = dict(shape)
+            for k in ('vertices', 'triangles', 'keys'):
+                if k in shape:
+                    shape[k] = max(1, int(shape[k]*scale))
+            filepath = os.path.join(tmp, name + '.b3d')
+            size = generate(filepath, **shape)
+
+            for mode in ('arrays', 'tuples') if tuples else ('arrays',):
+                for reader in ('file', 'mmap'):
+                    options = {'tuples': mode=='tuples', 'use_mmap': reader=='mmap'}
+                    for parser_name, parser in parsers:
+                        seconds = best_time(parser, options, filepath, repeat)
+                        record = {'case':name, 'parser':parser_name, 'mode':mode, 'reader':reader,
+                            'bytes':size, 'vertices':shape['vertices'], 'seconds':round(seconds, 6),
+                            'mb_per_s':round(size / seconds / 1e6, 2),
+                            'vertices_per_s':round(shape['vertices'] / seconds),
+                            'peak_bytes':peak_memory(parser, options, filepath)}
+                        results.append(record)
+                        print('%-8s %-9s %-6s %-4s %8.3f s %9.1f MB/s %12d vert/s %9.1f MB peak' % (
+                            name, parser_name, mode, reader, seconds, record['mb_per_s'],
+                            record['vertices_per_s'], record['peak_bytes'] / 1e6), file=sys.stderr)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {'commit':git_commit(), 'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':platform.python_version(), 'numpy':np.__version__, 'scale':scale,
+        'repeat':repeat, 'results':results}
+
+def compare(old, new):
+    key = lambda r: (r['case'], r['parser'], r['mode'], r['reader'])
+    before = {key(r): r for r in old['results']}
+    print('%-8s %-9s %-6s %-4s %10s %10s %8s' % ('case', 'parser', 'mode', 'io', old['commit'], new['commit'], 'speedup'))
+    for r in new['results']:
+        if key(r) in before:
+            a, b = before[key(r)]['seconds'], r['seconds']
+            print('%-8s %-9s %-6s %-4s %9.3fs %9.3fs %7.2fx' % (key(r) + (a, b, a / b)))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('cases', nargs='*', help='subset of: ' + ', '.join(cases))
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply vertex, triangle and key counts')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-tuples', action='store_true', help='skip the slow legacy tuples mode')
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    report = run(args.scale, args.repeat, args.cases, not args.no_tuples)
+    if args.out:
+        with open(args.out, 'w') as fp:
+            json.dump(report, fp, indent=1)
+    if args.compare:
+        with open(args.compare) as fp:
+            compare(json.load(fp), report)
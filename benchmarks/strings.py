@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+# TEXS decoding micro-benchmark: byte-at-a-time gets() against chunk-local scanning
+# usage: python -m benchmarks.strings [entries]
+
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from B3DParser import B3DParser, dotdict
+
+def make_texs(count):
+    entries = b''.join(('textures/levels/level1/tex%05d.png' % i).encode() + b'\x00'
+                       + struct.pack('2i5f', 1, 2, 0, 0, 1, 1, 0) for i in range(count))
+    return b'TEXS' + struct.pack('i', len(entries)) + entries
+
+
+class LegacyParser(B3DParser):
+    # TEXS decoding as it was done before chunk-local string scanning
+    def gets(self):
+        s = b''
+        while True:
+            c = self.fp.read(1)
+            if c == b'\x00':
+                return s.decode(errors='ignore')
+            s += c
+
+    def read_data(self, chunk, next):
+        data = []
+        while self.fp.tell()<next:
+            name = self.gets()
+            flags, blend = self.i(2)
+            pos = self.f(2)
+            scale = self.f(2)
+            rot = self.f(1)[0]
+            data.append(dotdict({'name':name,'position':pos,'scale':scale,'rotation':rot}))
+        return {'textures':data}
+
+
+def bench(parser, filepath, repeat=5):
+    best = None
+    for _ in range(repeat):
+        parser.fp = parser.reader(filepath)
+        start = time.perf_counter()
+        chunk, pos, size, next = parser.next_chunk()
+        data = parser.read_data(chunk, next)
+        elapsed = time.perf_counter() - start
+        parser.fp.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, data
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv)>1 else 10000
+    fd, filepath = tempfile.mkstemp(suffix='.b3d')
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(make_texs(count))
+    try:
+        legacy, expected = bench(LegacyParser(), filepath)
+        print('TEXS, %d entries, %d bytes' % (count, os.path.getsize(filepath)))
+        print('%-10s %10.2f ms' % ('gets()', legacy*1000))
+        for name, parser in (('file', B3DParser()), ('mmap', B3DParser(use_mmap=True))):
+            elapsed, data = bench(parser, filepath)
+            assert data == expected
+            print('%-10s %10.2f ms  %5.1fx' % (name, elapsed*1000, legacy/elapsed))
+    finally:
+        os.remove(filepath)
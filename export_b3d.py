@@ -49,9 +49,17 @@ bl_info = {
 
 
 import bpy
-import sys,os,os.path,struct,math,string
+import sys,os,os.path,struct,math,string,time
 import mathutils
 import math
+import numpy as np
+
+try:
+    from .B3DOptimize import weld_vertices, forsyth_order, first_use_order, acmr, reduce_keys, decompose, compose
+    from .B3DParser import keys_dtype, vrts_dtype, bone_dtype
+except ImportError:
+    from B3DOptimize import weld_vertices, forsyth_order, first_use_order, acmr, reduce_keys, decompose, compose
+    from B3DParser import keys_dtype, vrts_dtype, bone_dtype
 
 if not hasattr(sys,"argv"): sys.argv = ["???"]
 
@@ -61,9 +69,11 @@ b3d_parameters = {}
 texture_flags  = []
 texs_stack     = {}
 brus_stack     = []
-vertex_groups  = []
+vertex_count   = 0
+bone_weights   = {}
 bone_stack     = {}
-keys_stack     = []
+keys_stack     = {}
+pose_cache     = {}
 
 texture_count = 0
 
@@ -72,11 +82,18 @@ BONE_PARENT_MATRIX = 0
 BONE_PARENT = 1
 BONE_ITSELF = 2
 
+# bone_weights entry of a bone without weights
+NO_WEIGHTS = (np.empty(0, np.int64), np.empty(0, np.float32))
+
+# keys_stack entry of a bone without keys
+NO_KEYS = (np.empty(0, np.int64), np.empty((0, 3)), np.empty((0, 3)), np.empty((0, 4)))
+
 # texture stack indices constants
 TEXTURE_ID = 0
 TEXTURE_FLAGS = 1
 
 per_face_vertices = {}
+vertex_order = None
 
 the_scene = None
 
@@ -130,19 +147,116 @@ def getArmatureAnimationEnd(armature):
         
     return end_frame
 
+def set_frame(frame):
+    # frame_set evaluates the whole scene again, skip it when the frame is already current
+    if the_scene.frame_current != frame or the_scene.frame_subframe:
+        the_scene.frame_set(frame, subframe=0.0)
+
+def can_sample_action(armature):
+    # evaluating the action alone gives the same pose only for plain bone keys
+    anim_data = armature.animation_data
+    if not anim_data.action or anim_data.drivers or armature.constraints or armature.parent:
+        return False
+    if anim_data.action_blend_type != 'REPLACE' or anim_data.action_influence != 1.0:
+        return False
+    if any(track.strips and not track.mute for track in anim_data.nla_tracks):
+        return False
+    if any(not curve.data_path.startswith("pose.bones[") for curve in anim_data.action.fcurves):
+        return False
+    for pose_bone in armature.pose.bones:
+        bone = pose_bone.bone
+        if pose_bone.constraints or not bone.use_inherit_rotation or not bone.use_local_location:
+            return False
+        if getattr(bone, "inherit_scale", "FULL") != "FULL" or not getattr(bone, "use_inherit_scale", True):
+            return False
+    return True
+
+def sample_action(armature, first_frame, last_frame):
+    # pose matrices of armature.pose.bones on every frame from the action's fcurves,
+    # without updating the scene
+    frames = range(first_frame, last_frame+1)
+    curves = {(curve.data_path, curve.array_index): curve for curve in armature.animation_data.action.fcurves}
+    pose_bones = list(armature.pose.bones)
+    index = {pose_bone.name: i for i, pose_bone in enumerate(pose_bones)}
+    poses = np.empty((len(frames), len(pose_bones), 4, 4))
+
+    def channel(pose_bone, prop, size):
+        values = np.empty((len(frames), size))
+        path = pose_bone.path_from_id(prop)
+        for i in range(size):
+            curve = curves.get((path, i))
+            if curve is None or curve.mute:
+                values[:, i] = getattr(pose_bone, prop)[i]
+            else:
+                values[:, i] = [curve.evaluate(frame) for frame in frames]
+        return values
+
+    # parents first, every bone inherits its parent's pose fully (see can_sample_action)
+    for i in sorted(range(len(pose_bones)), key=lambda i: len(pose_bones[i].parent_recursive)):
+        pose_bone = pose_bones[i]
+        mode = pose_bone.rotation_mode
+        prop, size = {"QUATERNION": ("rotation_quaternion", 4), "AXIS_ANGLE": ("rotation_axis_angle", 4)}.get(mode, ("rotation_euler", 3))
+        # like Blender, connected bones ignore their location channel
+        if getattr(pose_bone.bone, "use_connect", False):
+            location = np.zeros((len(frames), 3))
+        else:
+            location = channel(pose_bone, "location", 3)
+        basis = compose(location, channel(pose_bone, prop, size), channel(pose_bone, "scale", 3), mode)
+        rest = np.array(pose_bone.bone.matrix_local)
+        if pose_bone.parent:
+            rest = np.linalg.inv(np.array(pose_bone.parent.bone.matrix_local)) @ rest
+            poses[:, i] = poses[:, index[pose_bone.parent.name]] @ rest @ basis
+        else:
+            poses[:, i] = rest @ basis
+    return poses
+
+def sample_scene(armature, first_frame, last_frame):
+    # pose and world matrices of the armature on every frame, setting the scene frame
+    poses = np.empty((last_frame - first_frame + 1, len(armature.pose.bones), 4, 4))
+    worlds = np.empty((len(poses), 4, 4))
+    pose = np.empty(len(armature.pose.bones)*16, np.float32)
+    for i, frame in enumerate(range(first_frame, last_frame+1)):
+        the_scene.frame_set(frame, subframe=0.0)
+        # foreach_get gives the pose matrices column-major
+        armature.pose.bones.foreach_get("matrix", pose)
+        poses[i] = pose.reshape(-1, 4, 4).transpose(0, 2, 1)
+        worlds[i] = np.array(armature.matrix_world)
+    return poses, worlds
+
+def sample_armature(armature, first_frame, last_frame):
+    # pose matrices (frames, pose bones, 4, 4) and world matrices (frames, 4, 4),
+    # sampled once per armature for all the meshes it deforms
+    key = (armature.name, first_frame, last_frame)
+    if key not in pose_cache:
+        start = time.time()
+        if b3d_parameters.get("sample-actions") and can_sample_action(armature):
+            source = "action"
+            poses = sample_action(armature, first_frame, last_frame)
+            worlds = np.broadcast_to(np.array(armature.matrix_world, np.float64), (len(poses), 4, 4))
+        else:
+            source = "scene"
+            poses, worlds = sample_scene(armature, first_frame, last_frame)
+        elapsed = time.time() - start
+        if PROGRESS: print("ANIM: %s %d frames sampled from the %s in %.2f s (%.0f frames/s)"
+                           % (armature.name, len(poses), source, elapsed, len(poses) / max(elapsed, 1e-9)))
+        pose_cache[key] = poses, worlds
+    return pose_cache[key]
+
 # ==== Write B3D File ====
 # (main exporter function)
 def write_b3d_file(filename, objects=[]):
     global texture_flags, texs_stack, trimmed_paths, tesselated_objects
-    global brus_stack, vertex_groups, bone_stack, keys_stack
+    global brus_stack, vertex_count, bone_weights, bone_stack, keys_stack, pose_cache
 
     #Global Stacks
     texture_flags = []
     texs_stack = {}
     brus_stack = []
-    vertex_groups = []
+    vertex_count = 0
+    bone_weights = {}
     bone_stack = []
-    keys_stack = []
+    keys_stack = {}
+    pose_cache = {}
     trimmed_paths = {}
     file_buf = bytearray()
     temp_buf = bytearray()
@@ -195,6 +309,9 @@ def getFaces(obj_data):
     return obj_data.polygons
 
 def getVertexColors(obj_data):
+    # 2.8 has per loop color layers again
+    if bpy.app.version >= (2, 80):
+        return obj_data.vertex_colors
     # BMesh in blender 2.63 broke this
     if bpy.app.version[1] >= 63:
         return tesselate_if_needed(obj_data).tessface_vertex_colors
@@ -588,7 +705,7 @@ def write_node(objects=[]):
             if DEBUG: print("    <mesh name=",obj.name,">")
             
             bone_stack = {}
-            keys_stack = []
+            keys_stack = {}
 
             anim_data = None
             
@@ -671,7 +788,7 @@ def write_node(objects=[]):
                     print("        <rotation>", quat.w, quat.x, quat.y, quat.z, "</rotation>")
             
             if anim_data:
-                the_scene.frame_set(1,subframe=0.0)
+                set_frame(1)
                 
                 arm_matrix = arm.matrix_world
                 
@@ -753,118 +870,52 @@ def write_node(objects=[]):
 
                     bone_stack[bone.name] = [par_matrix,parent,bone]
 
-                    if bone.children:
-                        for child in bone.children: read_armature(arm_matrix,child,bone)
+                # explicit stack instead of recursing into children, bone chains can be
+                # deeper than the recursion limit; bone_stack keeps the depth-first order
+                for root in arm.data.bones.values():
+                    if not root.parent:
+                        pending = [(root, None)]
+                        while pending:
+                            bone, parent = pending.pop()
+                            read_armature(arm_matrix,bone,parent)
+                            pending.extend((child, bone) for child in reversed(bone.children))
+
+                # bone order and parent indices are fixed per armature, the local matrices
+                # of all bones on all frames are computed in one pass and decomposed together
+                names = list(bone_stack)
+                index = {name: i for i, name in enumerate(names)}
+                parents = np.array([index[bone_stack[name][BONE_PARENT].name] if bone_stack[name][BONE_PARENT] else -1 for name in names], np.int64)
+                has_parent = parents >= 0
+                pose_index = {pose_bone.name: i for i, pose_bone in enumerate(arm.pose.bones)}
+                rows = np.array([pose_index[name] for name in names], np.int64)
+                transform = np.array([[-1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]], np.float64)
 
-                for bone in arm.data.bones.values():
-                    if not bone.parent:
-                        read_armature(arm_matrix,bone)
-
-                frame_count = first_frame
-                
                 last_frame = int(getArmatureAnimationEnd(arm))
                 num_frames = last_frame - first_frame
 
-                while frame_count <= last_frame:
+                poses, worlds = sample_armature(arm, first_frame, last_frame)
+                matrices = poses[:, rows]
+                local = np.empty_like(matrices)
 
-                    the_scene.frame_set(int(frame_count), subframe=0.0)
-                    
-                    if DEBUG: print("        <frame id=", int(frame_count), ">")
-                    arm_pose = arm.pose
-                    arm_matrix = arm.matrix_world
-                    
-                    transform = mathutils.Matrix([[-1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]])
-                    arm_matrix = transform @ arm_matrix
-
-                    for bone_name in arm.data.bones.keys():
-                        #bone_matrix = mathutils.Matrix(arm_pose.bones[bone_name].poseMatrix)
-                        bone_matrix = mathutils.Matrix(arm_pose.bones[bone_name].matrix)
-                        
-                        #print("(outer loop) bone_matrix for",bone_name,"=", bone_matrix)
-                        
-                        #print(bone_name,":",bone_matrix)
-                        
-                        #bone_matrix = bpy.data.scenes[0].objects[0].pose.bones['Bone'].matrix
-                        
-                        for ibone in bone_stack:
-                            
-                            bone = bone_stack[ibone]
-                            
-                            if bone[BONE_ITSELF].name == bone_name:
-                                
-                                if DEBUG: print("            <bone id=",ibone,"name=",bone_name,">")
-                                
-                                # == 2.4 exporter ==
-                                #if bone_stack[ibone][1]:
-                                #    par_matrix = Blender.Mathutils.Matrix(arm_pose.bones[bone_stack[ibone][1].name].poseMatrix)
-                                #    bone_matrix *= par_matrix.invert()
-                                #else:
-                                #    if b3d_parameters.get("local-space"):
-                                #        bone_matrix *= TRANS_MATRIX
-                                #    else:
-                                #        bone_matrix *= arm_matrix
-                                #bone_loc = bone_matrix.translationPart()
-                                #bone_rot = bone_matrix.rotationPart().toQuat()
-                                #bone_rot.normalize()
-                                #bone_sca = bone_matrix.scalePart()
-                                #keys_stack.append([frame_count - first_frame.val+1,bone_name,bone_loc,bone_sca,bone_rot])
-                                
-                                # if has parent
-                                if bone[BONE_PARENT]:
-                                    par_matrix = mathutils.Matrix(arm_pose.bones[bone[BONE_PARENT].name].matrix)
-                                    bone_matrix = par_matrix.inverted() @ bone_matrix
-                                else:
-                                    if b3d_parameters.get("local-space"):
-                                        bone_matrix = bone_matrix*mathutils.Matrix([[-1,0,0,0],[0,0,1,0],[0,1,0,0],[0,0,0,1]])
-                                    else:
-                                        
-                                        #if frame_count == 1:
-                                        #    print("====",bone_name,"====")
-                                        #    print("arm_matrix = ", arm_matrix)
-                                        #    print("bone_matrix = ", bone_matrix)
-                                        
-                                        bone_matrix = arm_matrix @ bone_matrix
-                                        
-                                        #if frame_count == 1:
-                                        #    print("arm_matrix*bone_matrix", bone_matrix)
-                                        
-                                
-                                #print("bone_matrix =", bone_matrix)
-                                
-                                bone_sca = bone_matrix.to_scale()
-                                bone_loc = bone_matrix.to_translation()
-                                
-                                # FIXME: silly tweaks to resemble the Blender 2.4 exporter output
-                                if b3d_parameters.get("local-space"):
-                                    
-                                    bone_rot = bone_matrix.to_quaternion()
-                                    bone_rot.normalize()
-                                    
-                                    
-                                    if not bone[BONE_PARENT]:
-                                        tmp = bone_rot.z
-                                        bone_rot.z = bone_rot.y
-                                        bone_rot.y = tmp
-                                        
-                                        bone_rot.x = -bone_rot.x
-                                    else:
-                                        tmp = bone_loc.z
-                                        bone_loc.z = bone_loc.y
-                                        bone_loc.y = tmp
-
-                                else:
-                                    bone_rot = bone_matrix.to_quaternion()
-                                    bone_rot.normalize()
+                local[:, has_parent] = np.linalg.inv(matrices[:, parents[has_parent]]) @ matrices[:, has_parent]
+                if b3d_parameters.get("local-space"):
+                    # element-wise, like mathutils' Matrix * Matrix
+                    local[:, ~has_parent] = matrices[:, ~has_parent] * transform
+                else:
+                    local[:, ~has_parent] = transform @ worlds[:, None] @ matrices[:, ~has_parent]
 
-                                keys_stack.append([frame_count - first_frame+1, bone_name, bone_loc, bone_sca, bone_rot])
-                                if DEBUG: print("                <loc>", bone_loc, "</loc>")
-                                if DEBUG: print("                <rot>", bone_rot, "</rot>")
-                                if DEBUG: print("                <scale>", bone_sca, "</scale>")
-                                if DEBUG: print("            </bone>")
+                bone_loc, bone_sca, bone_rot = decompose(local)
 
-                    frame_count += 1
+                # FIXME: silly tweaks to resemble the Blender 2.4 exporter output
+                if b3d_parameters.get("local-space"):
+                    bone_rot[:, ~has_parent] = bone_rot[:, ~has_parent][..., [0, 1, 3, 2]] * (1, -1, 1, 1)
+                    bone_loc[:, has_parent] = bone_loc[:, has_parent][..., [0, 2, 1]]
 
-                    if DEBUG: print("        </frame>")
+                # keys are indexed by bone for write_node_keys: frames, locations, scales, rotations
+                frames = np.arange(1, len(local)+1)
+                for i, name in enumerate(names):
+                    keys_stack[name] = (frames, bone_loc[:, i], bone_sca[:, i], bone_rot[:, i])
+                    if DEBUG: print("            <bone id=", name, "keys=", len(frames), "/>")
 
                 #Blender.Set("curframe",0)
                 #Blender.Window.Redraw()
@@ -874,9 +925,10 @@ def write_node(objects=[]):
             if anim_data:
                 temp_buf.append(write_node_anim(num_frames)) #NODE ANIM
 
+                children = bone_children()
                 for ibone in bone_stack:
                     if not bone_stack[ibone][BONE_PARENT]:
-                        temp_buf.append(write_node_node(ibone)) #NODE NODE
+                        temp_buf.append(write_node_node(ibone, children)) #NODE NODE
 
             obj_count += 1
 
@@ -995,8 +1047,6 @@ def write_node(objects=[]):
 
 # ==== Write NODE MESH Chunk ====
 def write_node_mesh(obj,obj_count,arm_action,exp_root):
-    global vertex_groups
-    vertex_groups = []
     mesh_buf = bytearray()
     temp_buf = bytearray()
 
@@ -1006,8 +1056,17 @@ def write_node_mesh(obj,obj_count,arm_action,exp_root):
         data = obj.to_mesh()
     
     temp_buf += write_int(-1) #Brush ID
-    temp_buf += write_node_mesh_vrts(obj, data, obj_count, arm_action, exp_root) #NODE MESH VRTS
-    temp_buf += write_node_mesh_tris(obj, data, obj_count, arm_action, exp_root) #NODE MESH TRIS
+    vrts_buf = write_node_mesh_vrts(obj, data, obj_count, arm_action, exp_root) #NODE MESH VRTS
+    tris_buf = write_node_mesh_tris(obj, data, obj_count, arm_action, exp_root) #NODE MESH TRIS
+    if vertex_order is not None:
+        # TRIS renumbered the vertices by first use, VRTS and the weights follow
+        values = np.frombuffer(vrts_buf, '<f4', offset=20).reshape(len(vertex_order), -1)
+        vrts_buf = vrts_buf[:20] + values[vertex_order].tobytes()
+        remap = np.empty(len(vertex_order), np.int64)
+        remap[vertex_order] = np.arange(len(vertex_order))
+        renumber_bone_weights(remap)
+    temp_buf += vrts_buf
+    temp_buf += tris_buf
 
     if len(temp_buf) > 0:
         mesh_buf += write_chunk(b"MESH",temp_buf)
@@ -1015,10 +1074,48 @@ def write_node_mesh(obj,obj_count,arm_action,exp_root):
 
     return mesh_buf
 
-def build_vertex_groups(data):
-    for f in getFaces(data):
-        for v in f.vertices:
-            vertex_groups.append({})
+# ==== Read skin weights ====
+# sparse weights of every vertex group per face corner, {name: (corners, weights)}
+# sorted by corner; zero weights and vertices outside a group are left out
+def read_bone_weights(obj, data, corner_vertex):
+    names = [vg.name for vg in obj.vertex_groups]
+
+    # one pass over the memberships each vertex actually has
+    vertices, groups, weights = [], [], []
+    for vert in data.vertices:
+        for element in vert.groups:
+            if element.weight:
+                vertices.append(vert.index)
+                groups.append(element.group)
+                weights.append(element.weight)
+    vertices = np.array(vertices, np.int64)
+    groups = np.array(groups, np.int64)
+    weights = np.array(weights, np.float32)
+
+    # every corner of a vertex gets the vertex's weights
+    order = np.argsort(corner_vertex, kind='stable')
+    counts = np.bincount(corner_vertex, minlength=len(data.vertices))
+    starts = np.cumsum(counts) - counts
+    repeat = counts[vertices]
+    entry = np.repeat(np.arange(len(vertices)), repeat)
+    offset = np.arange(repeat.sum()) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+    corners = order[starts[vertices][entry] + offset]
+    groups, weights = groups[entry], weights[entry]
+
+    by_group = np.lexsort((corners, groups))
+    corners, groups, weights = corners[by_group], groups[by_group], weights[by_group]
+    bounds = np.searchsorted(groups, np.arange(len(names)+1)).tolist()
+    return {name: (corners[a:b], weights[a:b]) for name, a, b in zip(names, bounds, bounds[1:]) if b > a}
+
+def renumber_bone_weights(remap, keep=None):
+    # move the weights to the new vertex numbers, where vertices were merged (keep
+    # is False for all but one of them) only one copy stays
+    for name, (corners, weights) in bone_weights.items():
+        if keep is not None:
+            corners, weights = corners[keep[corners]], weights[keep[corners]]
+        corners = remap[corners]
+        order = np.argsort(corners, kind='stable')
+        bone_weights[name] = corners[order], weights[order]
 
 
 # ==== Write NODE MESH VRTS Chunk ====
@@ -1036,6 +1133,7 @@ def write_node_mesh_vrts(obj, data, obj_count, arm_action, exp_root):
 
     #data = obj.getData(mesh = True)
     global the_scene
+    global bone_weights, vertex_count
     
     # FIXME: port to 2.5 API?
     #orig_uvlayer = data.activeUVLayer
@@ -1052,172 +1150,71 @@ def write_node_mesh_vrts(obj, data, obj_count, arm_action, exp_root):
     temp_buf.append(write_int(len(getUVTextures(data)))) #UV Set
     temp_buf.append(write_int(2)) #UV Set Size
 
-    # ---- Prepare the mesh "stack"
-    build_vertex_groups(data)
-    
-    # ---- Fill the mesh "stack"
-    if DEBUG: print("")
-    if DEBUG: print("        <!-- Building vertex_groups -->\n")
-
-    ivert = -1
-
-
-    #if PROGRESS_VERBOSE:
-    #    progress = 0
-    #    print("    vertex_groups, face:",0,"/",len(getFaces(data)))
-    
-    the_scene.frame_set(1,subframe=0.0)
+    set_frame(1)
     
     if b3d_parameters.get("local-space"):
         mesh_matrix = mathutils.Matrix()
     else:
         mesh_matrix = obj.matrix_world.copy()
-    
-    #import time
-
-    # new! 2.8 let's precalculate loop indices for every face and vertex id
-    me = data
-
-    my_uvs = {}
 
-    for f in me.polygons:
-
-        my_uvs[f.index] = []
-
-        for i in f.loop_indices:
-            l = me.loops[i]
-            v = me.vertices[l.vertex_index]
-            for j,ul in enumerate(me.uv_layers):
-                uv = ul.data[l.index].uv
-                my_uvs[f.index].append(uv)
+    # one vertex is written per face corner, in face order: the loops of every
+    # face are fetched with foreach_get and gathered into that order
+    faces = getFaces(data)
+    loop_start = np.empty(len(faces), np.int32)
+    loop_total = np.empty(len(faces), np.int32)
+    faces.foreach_get("loop_start", loop_start)
+    faces.foreach_get("loop_total", loop_total)
+    count = int(loop_total.sum())
+    first = np.cumsum(loop_total) - loop_total
+    corners = np.repeat(loop_start - first, loop_total) + np.arange(count)
+
+    for face_index, start, total in zip(range(len(faces)), first.tolist(), loop_total.tolist()):
+        per_face_vertices[face_index] = list(range(start, start+total))
+
+    def loop_values(collection, attr, size):
+        values = np.empty(len(collection)*size, np.float32)
+        collection.foreach_get(attr, values)
+        return values.reshape(-1, size)[corners]
+
+    loop_vertex = np.empty(len(data.loops), np.int32)
+    data.loops.foreach_get("vertex_index", loop_vertex)
+    corner_vertex = loop_vertex[corners]
+
+    coords = np.empty(len(data.vertices)*3, np.float32)
+    data.vertices.foreach_get("co", coords)
+    positions = coords.reshape(-1, 3)[corner_vertex]
+    if arm_action:
+        matrix = np.array(mesh_matrix, np.float64)
+        positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
 
+    # the records, with TRANS_MATRIX's y/z swap folded into the field order
     uv_layers_count = len(getUVTextures(data))
-    data.calc_normals_split() # ensure loop normals are valid
-    for face in getFaces(data):
-        
-        if DEBUG: print("        <!-- Face",face.index,"-->")
-        
-        #if PROGRESS_VERBOSE:
-        #    progress += 1
-        #    if (progress % 50 == 0): print("    vertex_groups, face:",progress,"/",len(data.faces))
-        
-        per_face_vertices[face.index] = []
-        
-        for vertex_id, loop_index in enumerate(face.loop_indices):
-            
-            loop = data.loops[loop_index]
-            vert = loop.vertex_index
-            ivert += 1
-                        
-            per_face_vertices[face.index].append(ivert)
-            
-            #a = time.time()
-                            
-            if arm_action:
-                v = mesh_matrix @ data.vertices[vert].co
-                vert_matrix = mathutils.Matrix.Translation(v)
-            else:
-                vert_matrix = mathutils.Matrix.Translation(data.vertices[vert].co)
+    vrts = np.empty(count, vrts_dtype(obj_flags, uv_layers_count, 2))
+    vrts["position"] = positions[:, [0, 2, 1]]
 
-            vert_matrix @= TRANS_MATRIX
-            vcoord = vert_matrix.to_translation()
+    if b3d_parameters.get("vertex-normals"):
+        data.calc_normals_split() # ensure loop normals are valid
+        normals = loop_values(data.loops, "normal", 3).astype(np.float64)
+        length = np.linalg.norm(normals, axis=1)
+        vrts["normal"] = normals[:, [0, 2, 1]] / np.where(length, length, 1)[:, None]
 
-            temp_buf.append(write_float_triplet(vcoord.x, vcoord.z, vcoord.y))
+    if obj_flags & 2:
+        colors = loop_values(getVertexColors(data)[0].data, "color", 4)
+        vrts["color"] = colors
+        vrts["color"][:, 3] = 1.0 #A (FIXME?)
 
-            #b = time.time()
-            #time_in_a += b - a
-            
-            if b3d_parameters.get("vertex-normals"):
-                norm_matrix = mathutils.Matrix.Translation(loop.normal)
+    for iuvlayer, uv_layer in enumerate(getUVTextures(data)):
+        uvs = loop_values(uv_layer.data, "uv", 2)
+        vrts["uv"][:, iuvlayer, 0] = uvs[:, 0]
+        vrts["uv"][:, iuvlayer, 1] = 1 - uvs[:, 1]
 
-                norm_matrix @= TRANS_MATRIX
-                normal_vector = norm_matrix.to_translation()
-                normal_vector.normalize()
-                
-                temp_buf.append(write_float_triplet(normal_vector.x,  #NX
-                                                    normal_vector.z,  #NY
-                                                    normal_vector.y)) #NZ
-
-            #c = time.time()
-            #time_in_b += c - b
-
-            if b3d_parameters.get("vertex-colors") and len(getVertexColors(data)) > 0:
-                vertex_colors = getVertexColors(data)
-                if vertex_id == 0:
-                    vcolor = vertex_colors[0].data[face.index].color1
-                elif vertex_id == 1:
-                    vcolor = vertex_colors[0].data[face.index].color2
-                elif vertex_id == 2:
-                    vcolor = vertex_colors[0].data[face.index].color3
-                elif vertex_id == 3:
-                    vcolor = vertex_colors[0].data[face.index].color4
-                
-                temp_buf.append(write_float_quad(vcolor.r, #R
-                                                 vcolor.g, #G
-                                                 vcolor.b, #B
-                                                 1.0))     #A (FIXME?)
-            
-            #d = time.time()
-            #time_in_b1 += d - c
-            
-            for vg in obj.vertex_groups:
-                w = 0.0
-                try:
-                    w = vg.weight(vert)
-                except:
-                    pass
-                vertex_groups[ivert][vg.name] = w
-
-
-            # NEW! 2.8 code to write uv from face and vertex_id
-            # vertex_id, vert is in enumerate (face.vertices)
-            # face is from data.polygons
-            # uv_layers_count is from data.uv_layers
-
-
-            for iuvlayer in range(uv_layers_count):
-                uv = my_uvs[face.index][vertex_id]
-                temp_buf.append(write_float_couple(uv[0], 1-uv[1]) )
-
-
-            #e = time.time()
-            #time_in_b2 += e - d
-
-            """
-            # ==== !!bottleneck here!! (40% of the function)
-            if vertex_id == 0:
-                for iuvlayer in range(uv_layers_count):
-                    uv = getUVTextures(data)[iuvlayer].data[face.index].uv1
-                    temp_buf.append(write_float_couple(uv[0], 1-uv[1]) ) # U, V
-            elif vertex_id == 1:
-                for iuvlayer in range(uv_layers_count):
-                    uv = getUVTextures(data)[iuvlayer].data[face.index].uv2
-                    temp_buf.append(write_float_couple(uv[0], 1-uv[1]) ) # U, V
-            elif vertex_id == 2:
-                for iuvlayer in range(uv_layers_count):
-                    uv = getUVTextures(data)[iuvlayer].data[face.index].uv3
-                    temp_buf.append(write_float_couple(uv[0], 1-uv[1]) ) # U, V
-            elif vertex_id == 3:
-                for iuvlayer in range(uv_layers_count):
-                    uv = getUVTextures(data)[iuvlayer].data[face.index].uv4
-                    temp_buf.append(write_float_couple(uv[0], 1-uv[1]) ) # U, V
-            """
-
-            #f = time.time()
-            #time_in_b3 += f - e
-            # =====================
+    bone_weights = read_bone_weights(obj, data, corner_vertex)
+    vertex_count = count
 
-    
-    if DEBUG: print("")
-    
-    #c = time.time()
-    #time_in_b += c - b
-    #print("time_in_a = ",time_in_a)
-    #print("time_in_b = ",time_in_b)
-    #print("time_in_b1 = ", time_in_b1)
-    #print("time_in_b2 = ", time_in_b2)
-    #print("time_in_b3 = ", time_in_b3)
-    #print("time_in_b4 = ", time_in_b4)
+    temp_buf.append(vrts.tobytes())
+
+    if b3d_parameters.get("weld-vertices") and count:
+        temp_buf = temp_buf[:3] + weld_node_mesh_vrts(obj, data, temp_buf[3], count)
 
     if len(temp_buf) > 0:
         vrts_buf += write_chunk(b"VRTS",b"".join(temp_buf))
@@ -1225,6 +1222,32 @@ def write_node_mesh_vrts(obj, data, obj_count, arm_action, exp_root):
 
     return vrts_buf
 
+# ==== Weld VRTS ====
+# one vertex was written per face corner, merge the identical ones and remap
+# per_face_vertices (TRIS) and bone_weights (BONE) to the welded indices
+def weld_node_mesh_vrts(obj, data, vrts, count):
+    global vertex_count
+    values = np.frombuffer(vrts, '<f4').reshape(count, -1)
+
+    # corners only merge when their bone weights match too
+    weights = np.zeros((count, len(bone_weights)), np.float32)
+    for column, (corners, group_weights) in enumerate(bone_weights.values()):
+        weights[corners, column] = group_weights
+    keys = np.hstack((values, weights))
+
+    kept, remap = weld_vertices(keys, b3d_parameters.get("weld-epsilon", 0.0))
+
+    for face in getFaces(data):
+        per_face_vertices[face.index] = remap[per_face_vertices[face.index]].tolist()
+    keep = np.zeros(count, bool)
+    keep[kept] = True
+    renumber_bone_weights(remap, keep)
+    vertex_count = len(kept)
+
+    if PROGRESS: print("VRTS:", obj.name, "welded", count, "->", len(kept), "vertices")
+
+    return [values[kept].tobytes()]
+
 # ==== Write NODE MESH TRIS Chunk ====
 def write_node_mesh_tris(obj, data, obj_count,arm_action,exp_root):
 
@@ -1307,14 +1330,16 @@ def write_node_mesh_tris(obj, data, obj_count,arm_action,exp_root):
     if DEBUG: print("        <!-- TRIS chunk -->")
     
     if PROGRESS_VERBOSE: progress = 0
-                
+
+    # triangles of every brush, as (A, B, C) vertex ids
+    brush_tris = []
     for brus_id in dBrushId2Face.keys():
         
         if PROGRESS_VERBOSE:
             progress += 1
             print("BRUS:",progress,"/",len(dBrushId2Face.keys()))
         
-        temp_buf = [write_int(brus_id)] #Brush ID
+        triangles = []
         
         if DEBUG: print("        <brush id=", brus_id, ">")
         
@@ -1328,20 +1353,33 @@ def write_node_mesh_tris(obj, data, obj_count,arm_action,exp_root):
 
             vertices = per_face_vertices[face.index]
 
-            temp_buf.append(write_int(vertices[2])) #A
-            temp_buf.append(write_int(vertices[1])) #B
-            temp_buf.append(write_int(vertices[0])) #C
+            triangles.append((vertices[2], vertices[1], vertices[0]))
 
             if DEBUG: print("            <face id=", vertices[2], vertices[1], vertices[0],"/> <!-- face",face.index,"-->")
 
             if len(face.vertices) == 4:
-                temp_buf.append(write_int(vertices[3])) #A
-                temp_buf.append(write_int(vertices[2])) #B
-                temp_buf.append(write_int(vertices[0])) #C
+                triangles.append((vertices[3], vertices[2], vertices[0]))
                 if DEBUG: print("            <face id=", vertices[3], vertices[2], vertices[0],"/> <!-- face",face.index,"-->")
 
         if DEBUG: print("        </brush>")
-        tris_buf += write_chunk(b"TRIS", b"".join(temp_buf))
+        brush_tris.append((brus_id, np.array(triangles, np.int32).reshape(-1, 3)))
+
+    global vertex_order
+    vertex_order = None
+    if b3d_parameters.get("optimize-tris") and brush_tris:
+        before = acmr(np.concatenate([t for b, t in brush_tris]))
+        brush_tris = [(b, t[forsyth_order(t)]) for b, t in brush_tris]
+        all_tris = np.concatenate([t for b, t in brush_tris])
+        after = acmr(all_tris)
+
+        # renumber vertices by first use, write_node_mesh reorders VRTS to match
+        vertex_order, remap = first_use_order(all_tris, vertex_count)
+        brush_tris = [(b, remap[t]) for b, t in brush_tris]
+
+        if PROGRESS: print("TRIS:", obj.name, "ACMR %.3f -> %.3f" % (before, after))
+
+    for brus_id, triangles in brush_tris:
+        tris_buf += write_chunk(b"TRIS", write_int(brus_id) + triangles.astype('<i4').tobytes())
 
     return tris_buf
 
@@ -1372,46 +1410,59 @@ def write_node_anim(num_frames):
     return anim_buf
 
 # ==== Write NODE NODE Chunk ====
-def write_node_node(ibone):
-    node_buf = bytearray()
-    temp_buf = []
+def bone_children():
+    # child bone keys by parent bone name, in bone_stack order
+    children = {}
+    for ibone in bone_stack:
+        parent = bone_stack[ibone][BONE_PARENT]
+        if parent:
+            children.setdefault(parent.name, []).append(ibone)
+    return children
+
+def write_node_node(ibone, children=None):
+    if children is None:
+        children = bone_children()
+
+    # explicit stack, bone chains can be deeper than the recursion limit;
+    # a NODE chunk is closed into its parent's buffer after its last child
+    node_buf = []
+    stack = [(ibone, node_buf, None)]
+    while stack:
+        ibone, parent_buf, temp_buf = stack.pop()
+        if temp_buf is not None:
+            parent_buf.append(write_chunk(b"NODE", b"".join(temp_buf)))
+            continue
 
-    bone = bone_stack[ibone]
+        temp_buf = []
+        bone = bone_stack[ibone]
 
-    matrix = bone[BONE_PARENT_MATRIX]
-    temp_buf.append(write_string(bone[BONE_ITSELF].name)) #Node Name
-    
+        matrix = bone[BONE_PARENT_MATRIX]
+        temp_buf.append(write_string(bone[BONE_ITSELF].name)) #Node Name
 
+        # FIXME: we should use the same matrix format everywhere to not require this
 
-    # FIXME: we should use the same matrix format everywhere to not require this
-    
-    position = matrix.to_translation()
-    if bone[BONE_PARENT]:
-        temp_buf.append(write_float_triplet(-position[0], position[2], position[1]))
-    else:
-        temp_buf.append(write_float_triplet(position[0], position[2], position[1]))
-    
-    
-    scale = matrix.to_scale()
-    temp_buf.append(write_float_triplet(scale[0], scale[2], scale[1]))
+        position = matrix.to_translation()
+        if bone[BONE_PARENT]:
+            temp_buf.append(write_float_triplet(-position[0], position[2], position[1]))
+        else:
+            temp_buf.append(write_float_triplet(position[0], position[2], position[1]))
 
-    quat = matrix.to_quaternion()
-    quat.normalize()
+        scale = matrix.to_scale()
+        temp_buf.append(write_float_triplet(scale[0], scale[2], scale[1]))
 
-    temp_buf.append(write_float_quad(quat.w, quat.x, quat.z, quat.y))
+        quat = matrix.to_quaternion()
+        quat.normalize()
 
-    temp_buf.append(write_node_bone(ibone))
-    temp_buf.append(write_node_keys(ibone))
+        temp_buf.append(write_float_quad(quat.w, quat.x, quat.z, quat.y))
 
-    for iibone in bone_stack:
-        if bone_stack[iibone][BONE_PARENT] == bone_stack[ibone][BONE_ITSELF]:
-            temp_buf.append(write_node_node(iibone))
+        temp_buf.append(write_node_bone(ibone))
+        temp_buf.append(write_node_keys(ibone))
 
-    if len(temp_buf) > 0:
-        node_buf += write_chunk(b"NODE", b"".join(temp_buf))
-        temp_buf = []
+        stack.append((ibone, parent_buf, temp_buf))
+        for iibone in reversed(children.get(bone[BONE_ITSELF].name, [])):
+            stack.append((iibone, temp_buf, None))
 
-    return node_buf
+    return node_buf[0]
 
 # ==== Write NODE BONE Chunk ====
 def write_node_bone(ibone):
@@ -1420,13 +1471,12 @@ def write_node_bone(ibone):
 
     my_name = bone_stack[ibone][BONE_ITSELF].name
 
-    for ivert in range(len(vertex_groups)):
-        if my_name in vertex_groups[ivert]:
-            vert_influ = vertex_groups[ivert][my_name]
-            #if DEBUG: print("        <bone name=",bone_stack[ibone][BONE_ITSELF].name,"face_vertex_id=", ivert + iuv,
-            #                " weigth=", vert_influ[1] , "/>")
-            temp_buf.append(write_int(ivert)) # Face Vertex ID
-            temp_buf.append(write_float(vert_influ)) #Weight
+    # Face Vertex IDs and Weights, zero weights were never collected
+    corners, weights = bone_weights.get(my_name, NO_WEIGHTS)
+    records = np.empty(len(corners), bone_dtype)
+    records['vertex_id'] = corners
+    records['weight'] = weights
+    temp_buf.append(records.tobytes())
 
     bone_buf += write_chunk(b"BONE", b"".join(temp_buf))
     temp_buf = []
@@ -1442,28 +1492,33 @@ def write_node_keys(ibone):
 
     my_name = bone_stack[ibone][BONE_ITSELF].name
 
-    for ikeys in range(len(keys_stack)):
-        if keys_stack[ikeys][1] == my_name:
-            temp_buf.append(write_int(keys_stack[ikeys][0])) #Frame
-
-            position = keys_stack[ikeys][2]
-            # FIXME: we should use the same matrix format everywhere and not require this
-            if b3d_parameters.get("local-space"):
-                if bone_stack[ibone][BONE_PARENT]:
-                    temp_buf.append(write_float_triplet(-position[0], position[2], position[1]))
-                else:
-                    temp_buf.append(write_float_triplet(position[0], position[2], position[1]))
-            else:
-                temp_buf.append(write_float_triplet(-position[0], position[1], position[2]))
+    # frames, locations, scales and (w, x, y, z) rotations as sampled in write_node
+    frames, positions, scales, rotations = keys_stack.get(my_name, NO_KEYS)
 
-            scale = keys_stack[ikeys][3]
-            temp_buf.append(write_float_triplet(scale[0], scale[1], scale[2]))
-
-            quat = keys_stack[ikeys][4]
-            quat.normalize()
-
-            temp_buf.append(write_float_quad(quat.w, -quat.x, quat.y, quat.z))
-            #break
+    # FIXME: we should use the same matrix format everywhere and not require this
+    if b3d_parameters.get("local-space"):
+        if bone_stack[ibone][BONE_PARENT]:
+            positions = positions[:, [0, 2, 1]] * (-1, 1, 1)
+        else:
+            positions = positions[:, [0, 2, 1]]
+    else:
+        positions = positions * (-1, 1, 1)
+    rotations = rotations * (1, -1, 1, 1)
+
+    keep = slice(None)
+    if b3d_parameters.get("reduce-keys") and len(frames):
+        keep = reduce_keys(frames, positions, scales, rotations,
+                           b3d_parameters.get("key-position-tolerance", 0.001),
+                           b3d_parameters.get("key-scale-tolerance", 0.001),
+                           b3d_parameters.get("key-rotation-tolerance", 0.001))
+        if PROGRESS: print("KEYS:", my_name, len(frames), "->", keep.sum(), "keys")
+
+    keys = np.empty(len(frames[keep]), keys_dtype(7))
+    keys['frame'] = frames[keep]
+    keys['position'] = positions[keep]
+    keys['scale'] = scales[keep]
+    keys['rotation'] = rotations[keep]
+    temp_buf.append(keys.tobytes())
 
     keys_buf += write_chunk(b"KEYS",b"".join(temp_buf))
     temp_buf = []
@@ -13,6 +13,7 @@ try:
     from bpy_extras.image_utils import load_image
     from bpy_extras.io_utils import unpack_list, unpack_face_list
     import bmesh
+    import numpy as np
 except:
     pass
 
@@ -20,6 +21,8 @@ def flip(v):
     return ((v[0],v[2],v[1]) if len(v)<4 else (v[0], v[1],v[3],v[2]))
 
 def flip_all(v):
+    if hasattr(v, 'ndim'):
+        return v[:, [0,2,1]] if v.shape[1]<4 else v[:, [0,1,3,2]]
     return [y for y in [flip(x) for x in v]]
 
 material_mapping = {}
@@ -175,12 +178,19 @@ def import_mesh(node, parent):
     mesh = bpy.data.meshes.new(node.name)
 
     # join face arrays
-    faces = []
-    for face in node.faces:
-        faces.extend(face.indices)
+    if isinstance(node.vertices, np.ndarray):
+        faces = np.concatenate([face.indices for face in node.faces] or [np.empty((0, 3), np.int32)])
+    else:
+        faces = []
+        for face in node.faces:
+            faces.extend(face.indices)
 
-    # create mesh from data
-    mesh.from_pydata(flip_all(node.vertices), [], flip_all(faces))
+    # create mesh from data, as lists: from_pydata before Blender 3.0 tests
+    # the faces argument for truth, which arrays do not support
+    vertices, faces = flip_all(node.vertices), flip_all(faces)
+    if isinstance(vertices, np.ndarray):
+        vertices, faces = vertices.tolist(), faces.tolist()
+    mesh.from_pydata(vertices, [], faces)
 
     # assign normals
     mesh.vertices.foreach_set('normal', unpack_list(node.normals))
@@ -190,39 +200,51 @@ def import_mesh(node, parent):
 
     # assign uv coordinates
     bpymesh = ob.data
-    uvs = [(0,0) if len(uv)==0 else (uv[0], 1-uv[1]) for uv in node.uvs]
-    uvlist = [i for poly in bpymesh.polygons for vidx in poly.vertices for i in uvs[vidx]]
-    bpymesh.uv_layers.new().data.foreach_set('uv', uvlist)
+    if isinstance(node.uvs, np.ndarray):
+        # array output is (vertices, sets, size), use the first set
+        if len(node.uvs) and node.uvs.shape[2] >= 2:
+            uvs = node.uvs[:, 0, :2] * (1, -1) + (0, 1)
+            loops = np.empty(len(bpymesh.loops), np.int32)
+            bpymesh.loops.foreach_get('vertex_index', loops)
+            bpymesh.uv_layers.new().data.foreach_set('uv', uvs[loops].ravel())
+    else:
+        uvs = [(0,0) if len(uv)==0 else (uv[0], 1-uv[1]) for uv in node.uvs]
+        uvlist = [i for poly in bpymesh.polygons for vidx in poly.vertices for i in uvs[vidx]]
+        bpymesh.uv_layers.new().data.foreach_set('uv', uvlist)
 
     # adding object materials (insert-ordered)
     for key, value in material_mapping.items():
         ob.data.materials.append(bpy.data.materials[value])
 
     # assign material_indexes
-    poly = 0
-    for face in node.faces:
-        for _ in face.indices:
-            ob.data.polygons[poly].material_index = face.brush_id
-            poly += 1
+    material_index = np.repeat([face.brush_id for face in node.faces],
+                               [len(face.indices) for face in node.faces])
+    ob.data.polygons.foreach_set('material_index', material_index)
 
     return ob
 
+# the object hierarchy walks below use explicit stacks, bone chains can be
+# deeper than the recursion limit
+
 def select_recursive(root):
-    for c in root.children:
-        select_recursive(c)
-    root.select_set(state=True)
+    stack = [root]
+    while stack:
+        ob = stack.pop()
+        stack.extend(ob.children)
+        ob.select_set(state=True)
 
 def make_armature_recursive(root, a, parent_bone):
-    bone = a.data.edit_bones.new(root.name)
-    v = root.matrix_world.to_translation()
-    bone.tail = v
-    # bone.head = (v[0]-0.01,v[1],v[2]) # large handles!
-    bone.parent = parent_bone
-    if bone.parent:
-        bone.head = bone.parent.tail
-    parent_bone = bone
-    for c in root.children:
-        make_armature_recursive(c, a, parent_bone)
+    stack = [(root, parent_bone)]
+    while stack:
+        root, parent_bone = stack.pop()
+        bone = a.data.edit_bones.new(root.name)
+        v = root.matrix_world.to_translation()
+        bone.tail = v
+        # bone.head = (v[0]-0.01,v[1],v[2]) # large handles!
+        bone.parent = parent_bone
+        if bone.parent:
+            bone.head = bone.parent.tail
+        stack.extend((c, bone) for c in reversed(root.children))
 
 def make_armatures():
     global ctx
@@ -270,10 +292,11 @@ def import_bone(node, parent=None):
     ob = bpy.data.objects.new(node.name, None)
 
     # fill weighting map for later use
-    w = []
-    for vert_id, weight in node['bones']:
-        w.append((vert_id, weight))
-    weighting[node.name] = w
+    if isinstance(node['bones'], tuple):
+        vertex_ids, weights = node['bones']
+        weighting[node.name] = list(zip(vertex_ids.tolist(), weights.tolist()))
+    else:
+        weighting[node.name] = list(node['bones'])
 
     # check parent, add root armature
     if parent and parent.type=='MESH':
@@ -281,29 +304,32 @@ def import_bone(node, parent=None):
 
     return ob
 
-def import_node_recursive(node, parent=None):
-    ob = None
+def import_node_recursive(root, parent=None):
+    # objects by parsed node, the parent of each node is created before it
+    objects = {}
+    for node, depth, node_parent in walk([root]):
+        parent_ob = objects[id(node_parent)] if node_parent is not None else parent
+        ob = None
 
-    if 'vertices' in node and 'faces' in node:
-        ob = import_mesh(node, parent)
-    elif 'bones' in node:
-        ob = import_bone(node, parent)
-    elif node.name:
-        ob = bpy.data.objects.new(node.name, None)
+        if 'vertices' in node and 'faces' in node:
+            ob = import_mesh(node, parent_ob)
+        elif 'bones' in node:
+            ob = import_bone(node, parent_ob)
+        elif node.name:
+            ob = bpy.data.objects.new(node.name, None)
 
-    if ob:
-        ctx.scene.collection.objects.link(ob)
+        if ob:
+            ctx.scene.collection.objects.link(ob)
 
-        if parent:
-            ob.parent = parent
+            if parent_ob:
+                ob.parent = parent_ob
 
-        ob.rotation_mode='QUATERNION'
-        ob.rotation_quaternion = flip(node.rotation)
-        ob.scale = flip(node.scale)
-        ob.location = flip(node.position)
+            ob.rotation_mode='QUATERNION'
+            ob.rotation_quaternion = flip(node.rotation)
+            ob.scale = flip(node.scale)
+            ob.location = flip(node.position)
 
-    for x in node.nodes:
-        import_node_recursive(x, ob)
+        objects[id(node)] = ob
 
 def load_b3d(filepath,
              context,